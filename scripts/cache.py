@@ -14,14 +14,15 @@ from .utils import ATPType, get_atp_cache_key
 r = Redis.from_url(str(CONFIG.redis_cache_dsn))
 
 
-def write_cache(key: str, value: Any) -> int:
+def write_cache(key: str, value: Any, ttl: Optional[int]=None) -> int:
     assert r
 
     serialized_val = json.dumps(value, separators=(',', ':'))
 
     r.set(
         key,
-        serialized_val 
+        serialized_val,
+        ex=ttl
     )
 
     return len(serialized_val)
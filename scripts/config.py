@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 """Configuration."""
+from typing import Optional
+
 from pydantic import HttpUrl, RedisDsn
 from pydantic_settings import BaseSettings
 
@@ -12,8 +14,40 @@ class Configuration(BaseSettings):
 
     data_dir: str = "cache"
 
+    # detection extract downloads: bytes written to disk per chunk
+    download_chunk_size: int = 1024 * 1024
+
     rw_gql_url: HttpUrl = 'https://gql.researchworkspace.com/graphql'
     rw_auth_token: str = 'you_must_set'
+    # seconds to keep resolved RW project/folder/file ids in redis
+    rw_resolve_ttl: int = 6 * 60 * 60
+
+    # outbound http: seconds to connect/read, retry attempts and exponential backoff base, pooled connections per host
+    http_connect_timeout: float = 10.0
+    http_read_timeout: float = 300.0
+    http_retries: int = 4
+    http_backoff_factor: float = 1.0
+    http_pool_size: int = 10
+
+    # visgraph shortest paths: decimal places endpoints are rounded to for memoization, and paths kept in process
+    path_cache_decimals: int = 5
+    path_cache_size: int = 65536
+    # visibility graph build: processes (all cores if unset), and tolerance in degrees to simplify land polygons by
+    visgraph_workers: Optional[int] = None
+    visgraph_simplify: Optional[float] = None
+    # water grid router: cell size in degrees
+    water_grid_resolution: float = 0.02
+
+    # GEOS concave hull summary: 0 is the most concave, 1 the convex hull
+    concave_hull_ratio: float = 0.3
+
+    # distribution summary track counting: 'raster' walks tracks over the grid lattice, 'sjoin' joins them with grid cell polygons
+    distribution_engine: str = "raster"
+
+    # processes daily/interpolated path aggregation shards animals over, 1 runs in process
+    agg_workers: int = 1
+    # load detections with memory compact dtypes (categorical names, small ints, float32 rounded coordinates)
+    compact_dtypes: bool = False
 
     class Config:
         """Configuration meta class."""
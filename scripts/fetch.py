@@ -1,24 +1,37 @@
-import re
+import json
+import os
+import sqlite3
 import sys
-from io import BytesIO
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from functools import cache
 from pathlib import Path
-from pprint import pformat
-from typing import Any, Dict, List, Optional
+from tempfile import TemporaryFile
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from zipfile import ZipFile
 
 import click
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
 from environs import Env
-from geopandas.tools import clip
 from jinjasql import JinjaSql
+from shapely.geometry.base import BaseGeometry
+from shapely.ops import unary_union
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 from tqdm import tqdm
 
+from . import httpclient
 from .log import logger
+from .cache import r
 from .config import CONFIG
+from .utils import lock
+from .rw import get_resolved_active_years, get_detection_file, get_file_url, resolve_project, resolve_projects
 
 
 class NoDataException(Exception):
@@ -28,9 +41,10 @@ class NoDataException(Exception):
     pass
 
 
+@cache
 def get_conn() -> Engine:
     """
-    Pulls database connection info from environment and creates an active connection.
+    Pulls database connection info from environment and creates the process-wide pooled engine.
     """
     env = Env()
 
@@ -41,11 +55,15 @@ def get_conn() -> Engine:
     database = env("DB_DATABASE")
 
     engine_string = f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
-    engine = create_engine(engine_string)
+    engine = create_engine(engine_string, pool_pre_ping=True)
 
     return engine
 
 
+# engines must not be shared with a forked child (celery prefork), it makes its own on first use
+os.register_at_fork(after_in_child=get_conn.cache_clear)
+
+
 def get_df(conn: Engine, table_name: str, trackercode: str) -> pd.DataFrame:
     """
     Don't use this.  big query.
@@ -64,17 +82,22 @@ def get_df_with_species(conn: Engine, table_name: str, trackercode: str, bin_siz
     Gets dataframe from OTN database with species information attached inline.
     """
     df = get_chunked_df(conn, table_name, trackercode, bin_size=bin_size)
-    df = get_species_for_df(conn, df)
+    df = get_species_for_df(df, conn=conn)
+    return df
 
 
-def get_chunked_df(conn: Engine, table_name: str, trackercode: str, bin_size: int=10000) -> pd.DataFrame:
+def stream_df(conn: Engine, table_name: str, trackercode: str, bin_size: int=10000) -> Iterator[pd.DataFrame]:
     """
-    Gets dataframe from database with chunked queries, no species information.
+    Streams a project's detections from the database bin_size rows at a time, no species information.
+
+    Uses a named server-side cursor, so only one chunk is ever held client side.  Rows come ordered by animal
+    then time, the same order as the detection store.
     """
     template = """
-        SELECT COUNT(t1.*)
+        SELECT t1.fieldnumber, t1.latitude, t1.longitude, t1.datecollected, t1.monthcollected, t1.relatedcatalogitem
         FROM obis.{{ table_name|sqlsafe }} t1
         WHERE trackercode={{ trackercode }}
+        ORDER BY t1.fieldnumber, t1.datecollected
     """
     j = JinjaSql(param_style='pyformat')
     query, bind_params = j.prepare_query(
@@ -85,40 +108,24 @@ def get_chunked_df(conn: Engine, table_name: str, trackercode: str, bin_size: in
         }
     )
 
-    cdf = pd.read_sql_query(
-        query,
-        conn,
-        params=bind_params,
-    )
-    row_count = cdf.iat[0, 0]
+    with conn.connect().execution_options(stream_results=True, max_row_buffer=bin_size) as sconn:
+        with tqdm(desc="Running SQL Query", unit=" rows") as progress_bar:
+            for chunk_df in pd.read_sql_query(
+                    query,
+                    sconn,
+                    params=bind_params,
+                    parse_dates=['datecollected'],
+                    chunksize=bin_size
+                ):
+                progress_bar.update(len(chunk_df))
+                yield chunk_df
 
-    # get number of chunks we will request
-    chunk_count = (row_count // bin_size) + 1
 
-    template = """
-        SELECT t1.fieldnumber, t1.latitude, t1.longitude, t1.datecollected, t1.monthcollected, t1.relatedcatalogitem
-        FROM obis.{{ table_name|sqlsafe }} t1
-        WHERE trackercode={{ trackercode }}
+def get_chunked_df(conn: Engine, table_name: str, trackercode: str, bin_size: int=10000) -> pd.DataFrame:
     """
-    query, bind_params = j.prepare_query(
-        template,
-        {
-            'table_name': table_name,
-            'trackercode': trackercode
-        }
-    )
-
-    frames: List[pd.DataFrame] = []
-    with tqdm(total=chunk_count, desc="Running SQL Query") as progress_bar:
-        for chunk_df in pd.read_sql_query(
-                query,
-                conn,
-                params=bind_params,
-                parse_dates=['datecollected'],
-                chunksize=bin_size
-            ):
-            progress_bar.update(1)
-            frames.append(chunk_df)
+    Gets dataframe from database with chunked queries, no species information.
+    """
+    frames = list(stream_df(conn, table_name, trackercode, bin_size=bin_size))
 
     if len(frames) == 0:
         raise NoDataException(f"No data found for {table_name}/{trackercode}")
@@ -127,14 +134,39 @@ def get_chunked_df(conn: Engine, table_name: str, trackercode: str, bin_size: in
     return df
 
 
-def get_species_for_df(df: pd.DataFrame, catalog_col: str='relatedcatalogitem', conn: Optional[Engine]=None, merge_kwargs: Optional[Dict[Any, Any]]=None) -> pd.DataFrame:
+SPECIES_COLUMNS = ['catalognumber', 'scientificname', 'commonname', 'aphiaid']
+"""Columns of the catalognumber -> species lookup."""
+
+
+def get_species_db() -> sqlite3.Connection:
+    """
+    Opens the local catalognumber -> species lookup table in CONFIG.data_dir, creating it if needed.
+
+    Rows mirror the distinct (catalognumber, scientificname, commonname, aphiaid) results of the OTN query, so a
+    catalog number with more than one distinct species row keeps all of them, same as querying OTN directly.
+    """
+    db = sqlite3.connect(Path(CONFIG.data_dir) / Path('species.sqlite'), timeout=60)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS species (
+            catalognumber TEXT NOT NULL,
+            scientificname TEXT,
+            commonname TEXT,
+            aphiaid INTEGER,
+            UNIQUE (catalognumber, scientificname, commonname, aphiaid)
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS species_catalognumber ON species (catalognumber)")
+    return db
+
+
+def query_species(catalognumbers: Sequence[str], conn: Optional[Engine]=None) -> pd.DataFrame:
+    """
+    Queries OTN's animal and scientific name tables for the species of each catalog number.
+    """
     if not conn:
         conn = get_conn()
 
-    # join with species info
-    relcatalogitems = list(df[catalog_col].unique())
-    logger.info("get_species_for_df: %d unique animals", len(relcatalogitems))
-
     j = JinjaSql(param_style='pyformat')
     template = """
         SELECT t2.catalognumber, t2.scientificname, t2.commonname, t3.aphiaidaccepted AS aphiaid
@@ -145,207 +177,184 @@ def get_species_for_df(df: pd.DataFrame, catalog_col: str='relatedcatalogitem',
     query, bind_params = j.prepare_query(
         template,
         {
-            'related_catalog_items': relcatalogitems
+            'related_catalog_items': list(catalognumbers)
         }
     )
-    
+
     species_df = pd.read_sql_query(
         query,
         conn,
         params=bind_params,
     ).drop_duplicates()     # otn_animals has multiple entries for each catalog item with notes (i guess?), we only select columns that should be the same
 
-    # merge species info with detections
+    return species_df
+
+
+def lookup_species(catalognumbers: Sequence[str], conn: Optional[Engine]=None, refresh: bool=False) -> pd.DataFrame:
+    """
+    Gets species info for catalog numbers, from the local lookup table where known and from OTN otherwise.
+
+    Anything fetched from OTN is added to the local table.  Catalog numbers OTN doesn't know about are absent
+    from the result and will be asked for again next time.
+
+    @param  refresh     Ignore the local table and query OTN for every catalog number.
+    """
+    catalognumbers = sorted(set(catalognumbers))
+
+    with closing(get_species_db()) as db:
+        known_df = pd.DataFrame(columns=SPECIES_COLUMNS)
+        if not refresh and catalognumbers:
+            db.execute("CREATE TEMP TABLE lookup (catalognumber TEXT PRIMARY KEY)")
+            db.executemany("INSERT INTO lookup VALUES (?)", ((c,) for c in catalognumbers))
+            known_df = pd.read_sql_query(
+                "SELECT s.* FROM species s JOIN lookup l ON s.catalognumber = l.catalognumber",
+                db
+            )
+
+        missing = sorted(set(catalognumbers) - set(known_df['catalognumber']))
+        logger.info("lookup_species: %d known, %d to query", len(catalognumbers) - len(missing), len(missing))
+
+        if not missing:
+            return known_df
+
+        fetched_df = query_species(missing, conn=conn)
+
+        with db:
+            # replace rather than add to whatever was known, NULL aphiaids never conflict in the unique constraint
+            db.executemany("DELETE FROM species WHERE catalognumber = ?", ((c,) for c in missing))
+            db.executemany(
+                "INSERT OR IGNORE INTO species VALUES (?, ?, ?, ?)",
+                (
+                    (c, s, cn, None if pd.isna(a) else int(a))
+                    for c, s, cn, a in fetched_df[SPECIES_COLUMNS].itertuples(index=False)
+                )
+            )
+
+    if known_df.empty:
+        return fetched_df
+
+    return pd.concat([known_df, fetched_df], ignore_index=True)
+
+
+def get_species_for_df(df: pd.DataFrame, catalog_col: str='relatedcatalogitem', conn: Optional[Engine]=None, merge_kwargs: Optional[Dict[Any, Any]]=None) -> pd.DataFrame:
+    # join with species info
+    relcatalogitems = list(df[catalog_col].unique())
+    logger.info("get_species_for_df: %d unique animals", len(relcatalogitems))
+
+    species_df = lookup_species(relcatalogitems, conn=conn)
+
+    return merge_species(df, species_df, catalog_col=catalog_col, merge_kwargs=merge_kwargs)
+
+
+def merge_species(df: pd.DataFrame, species_df: pd.DataFrame, catalog_col: str='relatedcatalogitem', merge_kwargs: Optional[Dict[Any, Any]]=None) -> pd.DataFrame:
+    """
+    Merges species info from lookup_species onto detections, dropping detections of unknown animals.
+    """
     merged_df = pd.merge(df, species_df, left_on=catalog_col, right_on='catalognumber',
-                         **merge_kwargs)
+                         **(merge_kwargs or {}))
     return merged_df
 
 
-def get_from_graphql(trackercode: str, year: str, path: str, subset_fields: bool = True):
-    assert CONFIG.rw_auth_token != "you_must_set"
+def download_to_tempfile(url: str, headers: Optional[Dict[str, str]]=None) -> IO[bytes]:
+    """
+    Streams the body of a GET request into a temporary file on disk, rewound and ready to read.
 
-    # query = """
-    # query FindDetections($trackercode: String, $year: String = "") {
-    #     organization(id: 2563073) {
-    #         name
-    #         projects(search: $trackercode) {
-    #             nodes {
-    #                 name
-    #                 folders(search: "Your tag detections") {
-    #                     nodes {
-    #                         files(search: $year) {
-    #                             nodes {
-    #                                 id,
-    #                                 name
-    #                             }
-    #                         }
-    #                     }
-    #                 }
-    #             }
-    #         }
-    #     }
-    # }
-    # """
-
-    # r = requests.post(
-    #     CONFIG.rw_gql_url,
-    #     json={
-    #         'operationName': None,
-    #         'query': query,
-    #         'variables': {'trackercode': trackercode, 'year': str(year)}
-    #     },
-    #     headers={
-    #         'Authorization': f'Bearer {CONFIG.rw_auth_token}'
-    #     }
-    # )
+    A real file rather than a SpooledTemporaryFile, which ZipFile can't read on Python 3.9 (no seekable()).
+    The caller is responsible for closing the returned file.
+    """
+    tf = TemporaryFile()
+    try:
+        with httpclient.get(url, headers=headers, stream=True) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=CONFIG.download_chunk_size):
+                tf.write(chunk)
+    except Exception:
+        tf.close()
+        raise
 
-    logger.info("get_from_graphql: finding project id")
-    query = """
-    query FindProject($trackercode: String) {
-        organization(id: 2563073) {
-            name
-            projects(search: $trackercode) {
-                nodes {
-                    name,
-                    id
-                }
-            }
-        }
-    }
+    tf.seek(0)
+    return tf
+
+
+def read_csv_from_zip(fileobj: IO[bytes], **kwargs) -> pd.DataFrame:
     """
-    r = requests.post(
-        CONFIG.rw_gql_url,
-        json={
-            'operationName': None,
-            'query': query,
-            'variables': {'trackercode': trackercode}
-        },
-        headers={
-            'Authorization': f'Bearer {CONFIG.rw_auth_token}'
-        }
-    )
+    Reads the single CSV member of a zip file into a dataframe.
 
-    if r.status_code != 200:
-        raise ValueError(f"get_from_graphql returned error ({r.status_code}):\n {pformat(r.text)}")
-
-    all_projects = r.json()['data']['organization']['projects']['nodes']
-    if len(all_projects) > 1:
-        # this might happen if you have the array and tag projects in RW - they are usually the same prefix and we can't search for word boundaries
-        # filter regex clientside
-        rprojectname = re.compile(f"{trackercode}\\b")
-        filter_projects = [p for p in all_projects if rprojectname.match(p['name'])]
-        if len(filter_projects) == 1:
-            logger.info("get_from_graphql: multiple matching projects for project '%s', found prefix match '%s...'", trackercode, filter_projects[0]['name'][0:20])
-            all_projects = filter_projects
-        else:
-            raise ValueError(f"Too many projects returned from graphql query ({len(all_projects)}): {','.join((p['name'] for p in all_projects))}")
-
-    project_id = all_projects[0]['id']
-
-    logger.info("get_from_graphql: finding folders in project %d", project_id)
-
-    # new query for folders in that project
-    query = """
-    query FindFoldersInProject($projectId: Float!) {
-        project(id: $projectId) {
-            id
-            folders(search: "Your tag detections") {
-                totalCount
-                nodes {
-                    id,
-                    name
-                }
-            }
-        }
-    }
+    The member is decompressed as it is parsed, so neither the compressed nor the decompressed bytes are ever held
+    in memory as a whole.  Extra kwargs are passed to pd.read_csv.
     """
-    r = requests.post(
-        CONFIG.rw_gql_url,
-        json={
-            'operationName': None,
-            'query': query,
-            'variables': {'projectId': project_id}
-        },
-        headers={
-            'Authorization': f'Bearer {CONFIG.rw_auth_token}'
-        }
-    )
+    with ZipFile(fileobj) as zf:
+        csv_names = [f for f in zf.namelist() if f.endswith('.csv')]
+        assert len(csv_names) == 1, f"Didn't find only one CSV in zip file {len(csv_names)}"
 
-    if r.status_code != 200:
-        raise ValueError(f"get_from_graphql returned error ({r.status_code}):\n {pformat(r.text)}")
+        with zf.open(csv_names[0]) as member:
+            return pd.read_csv(member, **kwargs)
 
-    folder_nodes = r.json()['data']['project']['folders']['nodes']
 
-    if len(folder_nodes) > 1:
-        raise ValueError(f"Too many folders returned from graphql query ({len(folder_nodes)})")
+_allowed_area_lock = threading.Lock()
 
-    folder_id = folder_nodes[0]['id']
 
-    logger.info("get_from_graphql: finding files in folder %d", folder_id)
+@cache
+def get_allowed_area(filename: str="data/allowed_area.geojson") -> BaseGeometry:
+    """
+    Loads the allowed area polygons as a single prepared geometry, once per process.
+    """
+    allowed_area = gpd.read_file(filename, driver="GeoJSON")
+    geom = unary_union(allowed_area.geometry.values)
+    shapely.prepare(geom)
+    return geom
 
-    # new query for files in that folder
-    query = """
-    query FindFileInFolder($folderId: Float!, $year : String = "") {
-        folder(id: $folderId) {
-            files(search: $year) {
-                nodes {
-                    id,
-                    name,
-                    deleted
-                }
-            }
-        }
-    }
+
+def in_allowed_area(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
     """
-    r = requests.post(
-        CONFIG.rw_gql_url,
-        json={
-            'operationName': None,
-            'query': query,
-            'variables': {'folderId': folder_id, 'year': str(year)}
-        },
-        headers={
-            'Authorization': f'Bearer {CONFIG.rw_auth_token}'
-        }
-    )
+    Boolean mask of which lon/lat pairs fall in the allowed area (boundary included, like a clip).
 
-    if r.status_code != 200:
-        raise ValueError(f"get_from_graphql returned error ({r.status_code}):\n {pformat(r.text)}")
+    Points outside the area's bounding box are rejected with plain array comparisons, only the rest get a
+    point-in-polygon test, and no point geometries are ever built.
+    """
+    area = get_allowed_area()
+    minx, miny, maxx, maxy = area.bounds
 
-    nodes = [n for n in r.json()['data']['folder']['files']['nodes'] if n['deleted'] == None and n['name'].endswith('.zip') and "external_partners" not in n['name']]
-    if len(nodes) > 1:
-        raise ValueError(f"Too many files returned from graphql query ({len(nodes)}): {','.join((n['name'] for n in nodes))}")
+    mask = (lons >= minx) & (lons <= maxx) & (lats >= miny) & (lats <= maxy)
+    candidates = np.flatnonzero(mask)
 
-    if len(nodes) == 0:
-        raise ValueError(f"No source data zip found in graphql query (trackercode: {trackercode}, year: {year})")
+    # GEOS builds the prepared geometry's point locator lazily on first query, don't let threads race on it
+    with _allowed_area_lock:
+        mask[candidates] = shapely.intersects_xy(area, lons[candidates], lats[candidates])
 
-    urls = [f"https://researchworkspace.com/files/{n['id']}/{n['name']}" for n in nodes]
-    url = urls[0]
+    return mask
 
-    logger.info("get_from_graphql: retrieving %s", nodes[0]['name'])
 
-    r = requests.get(url, headers={
-        'api-key': CONFIG.rw_auth_token
-    })
-    r.raise_for_status()
+def download_detections(trackercode: str, year: str, node: Optional[Dict[str, Any]]=None) -> Tuple[pd.DataFrame, Dict[str, Any], int]:
+    """
+    Downloads and cleans the RW detection extract for a project year, without attaching species info.
 
-    zf = ZipFile(BytesIO(r.content))
-    csv_names = [f for f in zf.namelist() if f.endswith('.csv')]
-    assert len(csv_names) == 1, f"Didn't find only one CSV in zip file {len(csv_names)}"
+    Returns the dataframe, the RW file node it came from and the downloaded size in bytes.
+    """
+    assert CONFIG.rw_auth_token != "you_must_set"
+
+    if node is None:
+        logger.info("download_detections: finding detection file")
+        node = get_detection_file(trackercode, year)
 
-    df = pd.read_csv(BytesIO(zf.read(csv_names[0])), parse_dates=['datecollected', 'datelastmodified'])
+    url = get_file_url(node)
 
-    df = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df.longitude, df.latitude), crs='EPSG:4326')
+    logger.info("download_detections: retrieving %s", node['name'])
+
+    with download_to_tempfile(url, headers={'api-key': CONFIG.rw_auth_token}) as zip_file:
+        zip_file.seek(0, os.SEEK_END)
+        size = zip_file.tell()
+        zip_file.seek(0)
+        df = read_csv_from_zip(zip_file, parse_dates=['datecollected', 'datelastmodified'])
 
     # filter for allowed area (custom poly)
     len_before = len(df)
-    logger.info("get_from_graphql: clipping, length before %d", len_before)
+    logger.info("download_detections: clipping, length before %d", len_before)
 
-    allowed_area = gpd.read_file("data/allowed_area.geojson", driver="GeoJSON")
-    df = clip(df, allowed_area)
+    df = df[in_allowed_area(df['longitude'].to_numpy(), df['latitude'].to_numpy())]
 
     len_after = len(df)
-    logger.info("get_from_graphql: clipping finished, length after %d (-%d)", len_after, len_before - len_after)
+    logger.info("download_detections: clipping finished, length after %d (-%d)", len_after, len_before - len_after)
 
     # cleanup dataframe
     # not sure of historical reason to rename tagname to fieldnumber, but it messes with remora's QC, so we'll duplicate
@@ -358,170 +367,307 @@ def get_from_graphql(trackercode: str, year: str, path: str, subset_fields: bool
     df['fieldnumber'] = df['tagname']
 
     len_before = len(df)
-    logger.info("get_from_graphql: filtering out NaN catalognumber records, length before %d", len_before)
+    logger.info("download_detections: filtering out NaN catalognumber records, length before %d", len_before)
 
     df = df[~df['catalognumber'].isna()]
 
     len_after = len(df)
-    logger.info("get_from_graphql: NaN filter finished, length after %d (-%d)", len_after, len_before - len_after)
-
-    # get species info, attach to df
-    df = get_species_for_df(df, catalog_col="catalognumber", merge_kwargs={'suffixes': [None, '_y']})
+    logger.info("download_detections: NaN filter finished, length after %d (-%d)", len_after, len_before - len_after)
 
     # filter for the year requested, due to some noise noticed in BLKTP
     df = df[df['yearcollected'] == int(year)]
 
+    return df, node, size
+
+
+def finish_detections(df: pd.DataFrame, species_df: pd.DataFrame, path: Union[str, Path], node: Dict[str, Any], size: int, subset_fields: bool = True) -> pd.DataFrame:
+    """
+    Attaches species info to downloaded detections and writes them, along with their manifest, to path.
+    """
+    df = merge_species(df, species_df, catalog_col="catalognumber", merge_kwargs={'suffixes': [None, '_y']})
+
     # subset to needed columns
     if subset_fields:
-        df = df[
-            ['fieldnumber',
-            'latitude',
-            'longitude',
-            'datecollected',
-            'monthcollected',
-            'scientificname',
-            'commonname',
-            'aphiaid']
-        ]
-    df.to_csv(path)
-    logger.info("get_from_graphql: wrote %s", str(path))
+        df = df[STORE_COLUMNS]
+    write_detections(df, path)
+    write_manifest(path, node, size)
+    logger.info("finish_detections: wrote %s", str(path))
 
     return df
 
 
-def get_project_active_years_from_graphql(trackercode: str) -> List[int]:
+def get_from_graphql(trackercode: str, year: str, path: str, subset_fields: bool = True):
+    df, node, size = download_detections(trackercode, year)
+
+    # get species info, attach to df
+    species_df = lookup_species(df['catalognumber'].unique())
+
+    return finish_detections(df, species_df, path, node, size, subset_fields=subset_fields)
+
+
+def get_store_path(trackercode: str, year: Union[int, str]) -> Path:
     """
-    Queries RW for a project code to get all active years available.
+    Path of the parquet detection store for a project year.
     """
-    assert CONFIG.rw_auth_token != "you_must_set"
+    return Path(CONFIG.data_dir) / Path(f"{trackercode}_{year}.parquet")
 
-    logger.debug("get_project_active_years_from_graphql: finding project id")
-    query = """
-    query FindProject($trackercode: String) {
-        organization(id: 2563073) {
-            name
-            projects(search: $trackercode) {
-                nodes {
-                    name,
-                    id
-                }
-            }
-        }
-    }
+
+def fetch_project_years(trackercode: str, years: Optional[Sequence[int]]=None, workers: int=4, force: bool=False) -> Tuple[Dict[int, Path], Dict[int, Exception]]:
     """
-    r = requests.post(
-        CONFIG.rw_gql_url,
-        json={
-            'operationName': None,
-            'query': query,
-            'variables': {'trackercode': trackercode}
-        },
-        headers={
-            'Authorization': f'Bearer {CONFIG.rw_auth_token}'
-        }
-    )
+    Downloads and prepares the detection stores for many years of a project at once.
 
-    if r.status_code != 200:
-        raise ValueError(f"get_project_active_years_from_graphql returned error ({r.status_code}):\n {pformat(r.text)}")
-
-    all_projects = r.json()['data']['organization']['projects']['nodes']
-    if len(all_projects) > 1:
-        # this might happen if you have the array and tag projects in RW - they are usually the same prefix and we can't search for word boundaries
-        # filter regex clientside
-        rprojectname = re.compile(f"{trackercode}\\b")
-        filter_projects = [p for p in all_projects if rprojectname.match(p['name'])]
-        if len(filter_projects) == 1:
-            logger.debug("get_project_active_years_from_graphql: multiple matching projects for project '%s', found prefix match '%s...'", trackercode, filter_projects[0]['name'][0:20])
-            all_projects = filter_projects
-        else:
-            raise ValueError(f"Too many projects returned from graphql query ({len(all_projects)}): {','.join((p['name'] for p in all_projects))}")
-    elif len(all_projects) == 0:
-        logger.warn("get_project_active_years_from_graphql: no projects found for %s", trackercode)
-        return []
-
-    project_id = all_projects[0]['id']
-
-    logger.debug("get_project_active_years_from_graphql: finding folders in project %d", project_id)
-
-    # new query for folders in that project
-    query = """
-    query FindFoldersInProject($projectId: Float!) {
-        project(id: $projectId) {
-            id
-            folders(search: "Your tag detections") {
-                totalCount
-                nodes {
-                    id,
-                    name
-                }
-            }
-        }
-    }
+    Years default to every active year in RW.  Downloads and cleaning run on a pool of `workers` threads, then
+    species info for every animal across all years is looked up in one batch.  Years whose RW file is unchanged
+    since their store was written are skipped unless force is set.  A year that fails is logged and left out, the
+    others are still written.
+
+    Returns a mapping of year -> store path for every year written, and of year -> error for every year that failed.
     """
-    r = requests.post(
-        CONFIG.rw_gql_url,
-        json={
-            'operationName': None,
-            'query': query,
-            'variables': {'projectId': project_id}
-        },
-        headers={
-            'Authorization': f'Bearer {CONFIG.rw_auth_token}'
-        }
-    )
+    resolution = resolve_project(trackercode, refresh=True)
+    if years is None:
+        years = get_resolved_active_years(resolution)
 
-    if r.status_code != 200:
-        raise ValueError(f"get_project_active_years_from_graphql returned error ({r.status_code}):\n {pformat(r.text)}")
+    def prepare(year: int) -> Optional[Tuple[pd.DataFrame, Dict[str, Any], int]]:
+        if not force and is_source_unchanged(trackercode, year, get_store_path(trackercode, year), refresh=False):
+            logger.info("fetch_project_years: %s/%d unchanged, skipping", trackercode, year)
+            return None
 
-    folder_nodes = r.json()['data']['project']['folders']['nodes']
+        return download_detections(trackercode, year, node=get_detection_file(trackercode, year))
+
+    prepared: Dict[int, Tuple[pd.DataFrame, Dict[str, Any], int]] = {}
+    failed: Dict[int, Exception] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(prepare, y): y for y in years}
+        for future in as_completed(futures):
+            year = futures[future]
+            try:
+                res = future.result()
+            except Exception as e:
+                logger.warning("fetch_project_years: %s/%d failed: %s", trackercode, year, e)
+                failed[year] = e
+                continue
+
+            if res is not None:
+                prepared[year] = res
+
+    if not prepared:
+        return {}, failed
+
+    catalognumbers = set().union(*(df['catalognumber'].unique() for df, _, _ in prepared.values()))
+    species_df = lookup_species(catalognumbers)
+
+    ret: Dict[int, Path] = {}
+    for year, (df, node, size) in sorted(prepared.items()):
+        path = get_store_path(trackercode, year)
+        try:
+            with lock(r, str(path)):
+                finish_detections(df, species_df, path, node, size)
+        except Exception as e:
+            logger.warning("fetch_project_years: %s/%d failed: %s", trackercode, year, e)
+            failed[year] = e
+            continue
 
-    if len(folder_nodes) > 1:
-        raise ValueError(f"Too many folders returned from graphql query ({len(folder_nodes)})")
+        ret[year] = path
 
-    folder_id = folder_nodes[0]['id']
+    return ret, failed
 
-    logger.debug("get_project_active_years_from_graphql: finding files in folder %d", folder_id)
 
-    # new query for files in that folder
-    query = """
-    query FindFilesInFolder($folderId: Float!) {
-        folder(id: $folderId) {
-            files {
-                nodes {
-                    id,
-                    name,
-                    deleted
-                }
-            }
-        }
+STORE_COLUMNS = ['fieldnumber', 'latitude', 'longitude', 'datecollected', 'monthcollected', 'scientificname', 'commonname', 'aphiaid']
+"""Columns kept in the detection store."""
+
+STORE_CATEGORICALS = ['fieldnumber', 'commonname', 'scientificname']
+"""Low cardinality string columns stored as categoricals in the detection store."""
+
+STORE_SCHEMA = pa.schema([
+    pa.field('fieldnumber', pa.dictionary(pa.int32(), pa.string())),
+    pa.field('latitude', pa.float64()),
+    pa.field('longitude', pa.float64()),
+    pa.field('datecollected', pa.timestamp('ns')),
+    pa.field('monthcollected', pa.int64()),
+    pa.field('scientificname', pa.dictionary(pa.int32(), pa.string())),
+    pa.field('commonname', pa.dictionary(pa.int32(), pa.string())),
+    pa.field('aphiaid', pa.int64()),
+])
+"""Parquet schema of the detection store when it is written in chunks, wide enough for any chunk."""
+
+
+def to_detection_store(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Types and orders a detections dataframe for the parquet detection store.
+
+    Rows are sorted by animal then time, name columns become categoricals and dates become native timestamps.
+    """
+    for col in ('datecollected', 'datelastmodified'):
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format='mixed')
+
+    df = df.sort_values(['fieldnumber', 'datecollected'], kind='stable', ignore_index=True)
+    return df.astype({c: 'category' for c in STORE_CATEGORICALS if c in df.columns})
+
+
+def write_detections(df: pd.DataFrame, path: Union[str, Path]):
+    """
+    Writes detections to the typed parquet store if path ends in .parquet, as a CSV otherwise.
+    """
+    p = Path(path)
+    if p.suffix != '.parquet':
+        df.to_csv(p)
+        return
+
+    # write aside and swap in so a failed write never leaves a truncated store behind
+    tmp = p.with_name(f"{p.name}.tmp")
+    to_detection_store(df).to_parquet(tmp, index=False)
+    os.replace(tmp, p)
+
+
+def write_detection_chunks(chunks: Iterable[pd.DataFrame], path: Union[str, Path]) -> int:
+    """
+    Writes detection chunks one at a time, to the parquet store if path ends in .parquet, as a CSV otherwise.
+
+    Chunks must already be in store order (see stream_df), each becomes its own parquet row group.  Nothing is
+    written if there are no rows.  Returns the number of rows written.
+    """
+    p = Path(path)
+    tmp = p.with_name(f"{p.name}.tmp")
+    is_parquet = p.suffix == '.parquet'
+
+    writer: Optional[pq.ParquetWriter] = None
+    rows = 0
+    tmp.unlink(missing_ok=True)     # leftovers of a failed write
+    try:
+        for chunk_df in chunks:
+            if len(chunk_df) == 0:
+                continue
+
+            if not is_parquet:
+                chunk_df.to_csv(tmp, mode='a', header=rows == 0)
+            else:
+                # every row group has to fit one schema, which the first chunk's categories or nulls can't decide
+                chunk_df = to_detection_store(chunk_df[STORE_COLUMNS]).astype({'monthcollected': 'Int64', 'aphiaid': 'Int64'})
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, STORE_SCHEMA)
+
+                writer.write_table(pa.Table.from_pandas(chunk_df, schema=STORE_SCHEMA, preserve_index=False))
+
+            rows += len(chunk_df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if rows > 0:
+        os.replace(tmp, p)
+
+    return rows
+
+
+def convert_csv_store(csv_path: Union[str, Path], path: Union[str, Path]) -> bool:
+    """
+    Converts a detections CSV written before the parquet store existed into the parquet store.
+
+    Only CSVs carrying species information are converted.  Returns if a conversion happened.
+    """
+    csv_path = Path(csv_path)
+    if not csv_path.exists():
+        return False
+
+    df = pd.read_csv(csv_path, index_col=0, parse_dates=['datecollected'])
+    if 'aphiaid' not in df.columns:
+        return False
+
+    write_detections(df, path)
+    return True
+
+
+def get_manifest_path(path: Union[str, Path]) -> Path:
+    """
+    Path of the manifest recording which RW file a cached detections CSV was built from.
+    """
+    p = Path(path)
+    return p.with_name(f"{p.stem}.manifest.json")
+
+
+def write_manifest(path: Union[str, Path], node: Dict[str, Any], size: int):
+    """
+    Records the RW file id, name and downloaded size next to a cached detections CSV.
+    """
+    manifest = {
+        'id': node['id'],
+        'name': node['name'],
+        'size': size
     }
+
+    with get_manifest_path(path).open('w') as f:
+        json.dump(manifest, f)
+
+
+def get_content_length(url: str) -> Optional[int]:
     """
-    r = requests.post(
-        CONFIG.rw_gql_url,
-        json={
-            'operationName': None,
-            'query': query,
-            'variables': {'folderId': folder_id}
-        },
-        headers={
-            'Authorization': f'Bearer {CONFIG.rw_auth_token}'
-        }
-    )
+    Asks RW for the size of a file without downloading it.
 
-    if r.status_code != 200:
-        raise ValueError(f"get_project_active_years_from_graphql returned error ({r.status_code}):\n {pformat(r.text)}")
+    None if the server doesn't say, or the request fails in any way: the size is only ever a shortcut to skip a
+    download, never a reason for one to fail.
+    """
+    try:
+        r = httpclient.head(url, headers={'api-key': CONFIG.rw_auth_token}, allow_redirects=True)
+        r.raise_for_status()
 
-    nodes = [n['name'] for n in r.json()['data']['folder']['files']['nodes'] if n['deleted'] == None and 'matched_detections' in n['name'] and n['name'].endswith('.zip')]
-    
-    # strip .zip off right, find last _, extract, convert to int (if able)
-    def tryint(n: str) -> Optional[int]:
-        try:
-            return int(n[n.rindex('_')+1:-4]) 
-        except ValueError:
-            return None
+        length = r.headers.get('Content-Length')
+        return int(length) if length is not None else None
+    except Exception as e:
+        logger.warning("get_content_length: could not get size of %s: %s", url, e)
+        return None
+
+
+def is_source_unchanged(trackercode: str, year: str, path: Union[str, Path], refresh: bool=True) -> bool:
+    """
+    Checks whether RW still serves the same detection file a cached CSV was built from.
+
+    The file id and name are compared against a fresh RW resolution, and the recorded size against the size RW
+    reports for the file.  Any cached CSV without a manifest, or whose size RW can't report, is considered changed.
+
+    @param  refresh     Re-resolve the project from RW rather than trusting a cached resolution.
+    """
+    p = Path(path)
+    mp = get_manifest_path(p)
+    if not p.exists() or not mp.exists():
+        return False
+
+    with mp.open() as f:
+        manifest = json.load(f)
+
+    node = get_detection_file(trackercode, year, refresh=refresh)
+    if node['id'] != manifest.get('id') or node['name'] != manifest.get('name'):
+        logger.info("is_source_unchanged: %s changed from %s to %s", str(p), manifest.get('name'), node['name'])
+        return False
+
+    size = get_content_length(get_file_url(node))
+    if size is None:
+        logger.info("is_source_unchanged: %s size unknown, assuming changed", str(p))
+        return False
 
-    years = [nn for nn in (tryint(n) for n in nodes) if nn is not None]
-    return sorted(years)
+    if size != manifest.get('size'):
+        logger.info("is_source_unchanged: %s size changed from %s to %d", str(p), manifest.get('size'), size)
+        return False
+
+    return True
+
+
+def get_project_active_years_from_graphql(trackercode: str) -> List[int]:
+    """
+    Queries RW for a project code to get all active years available.
+    """
+    return get_resolved_active_years(resolve_project(trackercode))
+
+
+def get_projects_active_years_from_graphql(trackercodes: Sequence[str]) -> Dict[str, List[int]]:
+    """
+    Gets all active years available for many project codes at once.
+
+    Uses a single RW query for every project not already resolved in cache.  Projects that can't be resolved
+    are logged and left out.
+    """
+    resolved = resolve_projects(trackercodes)
+    return {tc: get_resolved_active_years(resolved[tc]) for tc in trackercodes if tc in resolved}
 
 
 @click.group()
@@ -532,21 +678,37 @@ def cli():
 @click.command()
 @click.argument('trackercode')
 @click.argument('year')
-def do_get_all_tables(trackercode: str, year: str, path: str, conn: Optional[Engine] = None):
-    get_all_tables(trackercode, year, path, conn=conn)
+@click.option("-o", "--output-path", default=None)
+def do_get_all_tables(trackercode: str, year: str, output_path: Optional[str]):
+    get_all_tables(trackercode, year, output_path or get_store_path(trackercode, year))
 
-def get_all_tables(trackercode: str, year: str, path: str, conn: Optional[Engine] = None):
+def get_all_tables(trackercode: str, year: str, path: str, conn: Optional[Engine] = None, bin_size: int=100000):
+    """
+    Exports a project year from the OTN database, with species info, to a detection store (or CSV).
+
+    Detections are streamed from a server-side cursor, joined with species info and written chunk by chunk,
+    so memory use is bounded by bin_size no matter how big the table is.
+    """
     if not conn:
         conn = get_conn()
 
     table_name = f"otn_detections_{year}"
 
     print("get_all_tables: table:", table_name, file=sys.stderr)
-    df = get_df_with_species(conn, table_name, trackercode)
-    print("get_all_tables: length", len(df), file=sys.stderr)
+    chunks = (
+        get_species_for_df(chunk_df, conn=conn)
+        for chunk_df in stream_df(conn, table_name, trackercode, bin_size=bin_size)
+    )
+
+    # the store no longer holds what RW served, so it must not pass for an unchanged RW download
+    get_manifest_path(path).unlink(missing_ok=True)
 
     print("get_all_tables ->", path, file=sys.stderr)
-    df.to_csv(path)
+    length = write_detection_chunks(chunks, path)
+    print("get_all_tables: length", length, file=sys.stderr)
+
+    if length == 0:
+        raise NoDataException(f"No data found for {table_name}/{trackercode}")
 
 
 @click.command()
@@ -579,10 +741,24 @@ def get_detect_csv(trackercode: str, year: int, output_path: Optional[Path]):
     get_from_graphql(trackercode=trackercode, year=year, path=output_path, subset_fields=False)
 
 
+@click.command()
+@click.argument('trackercode')
+@click.option("-w", "--workers", type=int, default=4, help="Number of years downloaded at once")
+@click.option("--force/--no-force", default=False, help="Re-download years whose source file is unchanged")
+def fetch_project(trackercode: str, workers: int, force: bool):
+    written, failed = fetch_project_years(trackercode, workers=workers, force=force)
+    for year, path in sorted(written.items()):
+        print(year, "->", path, file=sys.stderr)
+
+    if failed:
+        raise click.ClickException("failed years: " + ", ".join(f"{y} ({e})" for y, e in sorted(failed.items())))
+
+
 cli.add_command(do_get_all_tables)
 cli.add_command(combine_projects)
 cli.add_command(get_active_years)
 cli.add_command(get_detect_csv)
+cli.add_command(fetch_project)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+"""Shared HTTP client for outbound calls (RW GraphQL/files, OTN geoserver)."""
+import os
+import threading
+from typing import Any, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import CONFIG
+
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+"""Response statuses that are retried with backoff."""
+
+RETRY_METHODS = frozenset(['HEAD', 'GET', 'POST'])
+"""Methods that are retried.  POST is included because every POST we make is a read-only GraphQL query."""
+
+
+_local = threading.local()
+
+
+def _reset_sessions():
+    """
+    Drops all sessions so a forked child (celery prefork) never shares pooled sockets with its parent.
+    """
+    global _local
+    _local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_sessions)
+
+
+def build_session(
+    retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+    pool_size: Optional[int] = None,
+    retry_statuses: Iterable[int] = RETRY_STATUSES,
+) -> requests.Session:
+    """
+    Creates a keep-alive session that retries connection errors and retryable statuses with exponential backoff.
+
+    Parameters default to their CONFIG.http_* settings.  Once retries are exhausted on a retryable status the
+    last response is returned rather than raised, so callers keep handling status codes themselves.
+    """
+    retry = Retry(
+        total=CONFIG.http_retries if retries is None else retries,
+        backoff_factor=CONFIG.http_backoff_factor if backoff_factor is None else backoff_factor,
+        status_forcelist=retry_statuses,
+        allowed_methods=RETRY_METHODS,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    pool_size = CONFIG.http_pool_size if pool_size is None else pool_size
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Returns this thread's shared session, creating it on first use.
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = build_session()
+
+    return session
+
+
+def request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    Sends a request through the shared session, applying the configured (connect, read) timeout unless one is given.
+    """
+    kwargs.setdefault('timeout', (CONFIG.http_connect_timeout, CONFIG.http_read_timeout))
+    return get_session().request(method, str(url), **kwargs)
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    """GET through the shared session."""
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    """POST through the shared session."""
+    return request('POST', url, **kwargs)
+
+
+def head(url: str, **kwargs: Any) -> requests.Response:
+    """HEAD through the shared session."""
+    return request('HEAD', url, **kwargs)
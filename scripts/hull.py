@@ -1,14 +1,31 @@
 import numpy as np
 import math
-from shapely.geometry import Point, LineString, Polygon
-from shapely.ops import transform
-from functools import partial
+from scipy.spatial import cKDTree
+import shapely
+from shapely.geometry import Polygon
+from functools import cache
 import pyproj
 
 
+@cache
+def get_transformer(from_crs, to_crs):
+    """
+    Shared lon/lat ordered transformer between two CRS, built once per process
+    """
+    return pyproj.Transformer.from_crs(from_crs, to_crs, always_xy=True)
+
+
+def transform_geometry(geom, from_crs, to_crs):
+    """
+    Reprojects every coordinate of a geometry in one call
+    """
+    transformer = get_transformer(from_crs, to_crs)
+    return shapely.transform(geom, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
 class ConcaveHull:
 
-    def __init__(self, points, prime_ix=0):
+    def __init__(self, points, prime_ix=0, tree=None):
         if isinstance(points, np.core.ndarray):
             self.data_set = points
         elif isinstance(points, list):
@@ -23,22 +40,19 @@ class ConcaveHull:
         # Create the initial index
         self.indices = np.ones(self.data_set.shape[0], dtype=bool)
 
+        # Nearest neighbour index, shared with the retries for larger k
+        self.tree = tree if tree is not None else self.build_tree(self.data_set)
+
         self.prime_k = np.array([3, 5, 7, 11, 13, 17, 21, 23, 29, 31, 37, 41, 43,
                                  47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97])
         self.prime_ix = prime_ix
 
     @staticmethod
     def buffer_in_meters(hull, meters):
-        proj_meters = pyproj.Proj('epsg:3857')
-        proj_latlng = pyproj.Proj('epsg:4326')
-
-        project_to_meters = partial(pyproj.transform, proj_latlng, proj_meters)
-        project_to_latlng = partial(pyproj.transform, proj_meters, proj_latlng)
-
-        hull_meters = transform(project_to_meters, hull)
+        hull_meters = transform_geometry(hull, 'epsg:4326', 'epsg:3857')
 
         buffer_meters = hull_meters.buffer(meters)
-        buffer_latlng = transform(project_to_latlng, buffer_meters)
+        buffer_latlng = transform_geometry(buffer_meters, 'epsg:3857', 'epsg:4326')
         return buffer_latlng
 
     def get_next_k(self):
@@ -62,6 +76,22 @@ class ConcaveHull:
         meters = 6371000.0 * c
         return meters
 
+    @staticmethod
+    def build_tree(points):
+        """
+        Builds a KD-tree over lon/lat points placed on the unit sphere.
+        Straight-line distance on the sphere orders neighbours the same way as the haversine distance.
+        :param points: Array (N, 2) of lon/lat points
+        :return: cKDTree over the (N, 3) unit vectors
+        """
+        lons, lats = np.radians(points[:, 0]), np.radians(points[:, 1])
+        xyz = np.column_stack([
+            np.cos(lats) * np.cos(lons),
+            np.cos(lats) * np.sin(lons),
+            np.sin(lats)
+        ])
+        return cKDTree(xyz)
+
     @staticmethod
     def get_lowest_latitude_index(points):
         indices = np.argsort(points[:, 1])
@@ -75,15 +105,18 @@ class ConcaveHull:
         :return: Array of indices into the data set array
         """
         ixs = self.indices
-
-        base_indices = np.arange(len(ixs))[ixs]
-        distances = self.haversine_distance(
-            self.data_set[ix, :], self.data_set[ixs, :])
-        sorted_indices = np.argsort(distances)
-
-        kk = min(k, len(sorted_indices))
-        k_nearest = sorted_indices[range(kk)]
-        return base_indices[k_nearest]
+        kk = min(k, np.count_nonzero(ixs))
+        total = len(ixs)
+
+        # removed points come back from the tree too, widen the query until enough remaining ones are found
+        query_k = min(2 * kk + 1, total)
+        while True:
+            _, nearest = self.tree.query(self.tree.data[ix], k=query_k)
+            nearest = np.atleast_1d(nearest)
+            remaining = nearest[ixs[nearest]]
+            if len(remaining) >= kk or query_k == total:
+                return remaining[:kk]
+            query_k = min(2 * query_k, total)
 
     def calculate_headings(self, ix, ixs, ref_heading=0.0):
         """
@@ -109,12 +142,84 @@ class ConcaveHull:
         bearings[bearings < 0.0] += 360.0
         return bearings
 
+    @staticmethod
+    def orientation(o, a, b):
+        """
+        Cross product of (a - o) and (b - o): positive if o, a, b turn counterclockwise, zero if collinear.
+        :param o: Point (2,) or points (N, 2)
+        :param a: Point (2,) or points (N, 2)
+        :param b: Point (2,) or points (N, 2)
+        :return: Array (N,) or scalar of cross products
+        """
+        o, a, b = np.asarray(o), np.asarray(a), np.asarray(b)
+        return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+    @classmethod
+    def segments_intersect(cls, p1, p2, a, b):
+        """
+        Tests the segment p1-p2 against many segments a-b at once, touching counts as intersecting
+        :param p1: Start point (2,) of the segment
+        :param p2: End point (2,) of the segment
+        :param a: Start points (N, 2) of the segments to test against
+        :param b: End points (N, 2) of the segments to test against
+        :return: Boolean array (N,)
+        """
+        d1 = np.sign(cls.orientation(a, b, p1))
+        d2 = np.sign(cls.orientation(a, b, p2))
+        d3 = np.sign(cls.orientation(p1, p2, a))
+        d4 = np.sign(cls.orientation(p1, p2, b))
+
+        def on_segment(s, t, q):
+            return np.all((np.minimum(s, t) <= q) & (q <= np.maximum(s, t)), axis=-1)
+
+        proper = (d1 * d2 < 0) & (d3 * d4 < 0)
+        touching = ((d1 == 0) & on_segment(a, b, p1)) | ((d2 == 0) & on_segment(a, b, p2)) | \
+            ((d3 == 0) & on_segment(p1, p2, a)) | ((d4 == 0) & on_segment(p1, p2, b))
+        return proper | touching
+
+    @classmethod
+    def folds_back(cls, shared, a, b):
+        """
+        Tests whether two segments from a shared end point to a and b overlap, i.e. run collinear in the same direction
+        """
+        return cls.orientation(shared, a, b) == 0 and np.dot(a - shared, b - shared) > 0
+
+    @classmethod
+    def is_simple_extension(cls, hull, candidate):
+        """
+        Tests whether appending a point keeps the hull path free of self-intersections, given that it already is.
+        Only the new edge is tested, and only against the existing edges its bounding box overlaps.
+        Closing the path onto its first point is allowed.
+        :param hull: Array (M, 2) of the hull path so far
+        :param candidate: Point (2,) to append
+        :return: True if the extended path is simple
+        """
+        last = hull[-1]
+        closing = np.array_equal(candidate, hull[0])
+
+        # the edges meeting the new one at a shared vertex may only touch it there
+        if len(hull) > 1 and cls.folds_back(last, candidate, hull[-2]):
+            return False
+
+        if closing and len(hull) > 2 and cls.folds_back(hull[0], last, hull[1]):
+            return False
+
+        # every other edge must not touch the new one at all
+        starts, ends = hull[:-2], hull[1:-1]
+        if closing:
+            starts, ends = starts[1:], ends[1:]
+
+        lo, hi = np.minimum(last, candidate), np.maximum(last, candidate)
+        near = np.all((np.minimum(starts, ends) <= hi) & (np.maximum(starts, ends) >= lo), axis=1)
+
+        return not cls.segments_intersect(last, candidate, starts[near], ends[near]).any()
+
     def recurse_calculate(self):
         """
-        Calculates the concave hull using the next value for k while reusing the distances dictionary
+        Calculates the concave hull using the next value for k while reusing the neighbour index
         :return: Concave hull
         """
-        recurse = ConcaveHull(self.data_set, self.prime_ix + 1)
+        recurse = ConcaveHull(self.data_set, self.prime_ix + 1, tree=self.tree)
         next_k = recurse.get_next_k()
         if next_k == -1:
             return None
@@ -139,9 +244,8 @@ class ConcaveHull:
         first_point = self.get_lowest_latitude_index(self.data_set)
         current_point = first_point
 
-        # Note that hull and test_hull are matrices (N, 2)
-        hull = np.array(Point(self.data_set[first_point, :]))
-        test_hull = hull
+        # Note that hull is a matrix (N, 2)
+        hull = self.data_set[[first_point], :]
 
         # Remove the first point
         self.indices[first_point] = False
@@ -170,12 +274,8 @@ class ConcaveHull:
             while invalid_hull and i < len(candidates):
                 candidate = candidates[i]
 
-                # Create a test hull to check if there are any self-intersections
-                next_point = np.array(Point(self.data_set[knn[candidate]]))
-                test_hull = np.append(hull, next_point)
-
-                line = LineString(test_hull)
-                invalid_hull = not line.is_simple
+                # Check if the new edge would make any self-intersections
+                invalid_hull = not self.is_simple_extension(hull, self.data_set[knn[candidate]])
                 i += 1
 
             if invalid_hull:
@@ -185,25 +285,20 @@ class ConcaveHull:
             prev_angle = self.calculate_headings(
                 knn[candidate], np.array([current_point]))
             current_point = knn[candidate]
-            hull = test_hull
+            hull = np.vstack([hull, self.data_set[current_point]])
 
             self.indices[current_point] = False
             step += 1
 
         poly = Polygon(hull)
+        shapely.prepare(poly)
+
+        # Every point must be inside or on the hull, allowing for points a hair outside its edges
+        outside = ~shapely.intersects_xy(poly, self.data_set[:, 0], self.data_set[:, 1])
+        if outside.any():
+            outside[outside] = shapely.distance(poly, shapely.points(self.data_set[outside])) >= 1e-5
 
-        count = 0
-        total = self.data_set.shape[0]
-        for ix in range(total):
-            pt = Point(self.data_set[ix, :])
-            if poly.intersects(pt) or pt.within(poly):
-                count += 1
-            else:
-                d = poly.distance(pt)
-                if d < 1e-5:
-                    count += 1
-
-        if count == total:
+        if not outside.any():
             return hull
         else:
             return self.recurse_calculate()
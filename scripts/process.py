@@ -1,8 +1,10 @@
+import hashlib
 import json
 import math
+import multiprocessing
 import os
 import sys
-from functools import cache, singledispatch
+from functools import cache, lru_cache, partial, singledispatch
 from io import BytesIO
 from pathlib import PosixPath as Path
 from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
@@ -13,14 +15,19 @@ import pandas as pd
 import geojson
 import geopandas
 import orjson
+import pyarrow.parquet as pq
 import pyvisgraph as vg
 import requests
-from shapely.geometry import box, LineString, Polygon, MultiPolygon, geo
+import shapely
+from billiard import Pool
+from geopandas.array import GeometryArray
+from shapely.geometry import box, LineString, Point, Polygon, MultiPolygon, geo
 from shapely.geometry.base import BaseGeometry
 from shapely.ops import unary_union
 from shapely_geojson import Feature, FeatureCollection
 from skimage.measure import find_contours
 from scipy.interpolate import interp1d
+from scipy.spatial import ConvexHull, QhullError
 from scipy.stats import gaussian_kde
 from tqdm import tqdm
 
@@ -30,10 +37,12 @@ try:
 except ImportError:
     from .hull import ConcaveHull
     
-from .fetch import get_all_tables, get_from_graphql
+from . import httpclient
+from .fetch import STORE_CATEGORICALS, STORE_COLUMNS, convert_csv_store, get_all_tables, get_from_graphql, get_store_path, is_source_unchanged
 from .config import CONFIG
-from .utils import lock
+from .utils import lock, replacing
 from .cache import r
+from .waterroute import build_water_grid
 from .log import logger
 
 
@@ -47,13 +56,28 @@ def raw(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     return to_gdf(month_df)
 
 
+def _mean_positions(df: pd.DataFrame, time_field: str) -> pd.DataFrame:
+    """
+    Averages each animal's coordinates over each value of time_field, carrying its aphiaid and names through as-is.
+
+    Only the coordinates are averaged, so name columns can be categoricals and coordinates keep their float width.
+    """
+    grouped = df.groupby(['fieldnumber', time_field], observed=True)
+    avgs = grouped[['latitude', 'longitude']].mean()
+
+    constants = [c for c in ['aphiaid', 'commonname', 'scientificname'] if c in df.columns]
+    avgs[constants] = grouped[constants].first()
+
+    return avgs
+
+
 def monthly_avg(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     """
     Takes raw data, does any processing on the raw values, returns a GeoDataFrame
     """
     # get average position of each animal fieldnumber over the month
     time_field = 'monthcollected'
-    avgs = df.groupby(['fieldnumber', time_field]).agg('mean')
+    avgs = _mean_positions(df, time_field)
 
     # remove animal fieldnumber from index
     avgs.reset_index(0, inplace=True)
@@ -64,62 +88,143 @@ def monthly_avg(df: pd.DataFrame) -> geopandas.GeoDataFrame:
 def weekly_avg(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     # get average position of each animal fieldnumber over each week
     time_field = 'weekcollected'
-    avgs = df.groupby(['fieldnumber', time_field]).agg('mean')
+    avgs = _mean_positions(df, time_field)
 
-    avgs['monthcollected'] = avgs['monthcollected'].round().astype(int)
+    # weeks can span two months, use the rounded mean month of the animal's detections that week
+    months = df.groupby(['fieldnumber', time_field], observed=True)['monthcollected'].mean()
+    avgs['monthcollected'] = months.round().astype(df['monthcollected'].dtype)
     avgs.set_index('monthcollected', inplace=True)
 
     return to_gdf(avgs)
 
 
-def daily_avg(df: pd.DataFrame) -> geopandas.GeoDataFrame:
+def _daily_positions(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
-    For each animal, interpolate the path between detections (daily).
+    Averages every animal's position over each day it was detected, in one grouped mean over (fieldnumber, day).
+
+    Returns the daily positions (animal, datecollected, latitude, longitude) ordered by animal then day, where
+    animal is an integer code, and the per-animal constants (fieldnumber, names, aphiaid) indexed by that code.
+    Constants are taken from each animal's first row.
     """
-    grouped_df = df.drop(columns=['weekcollected', 'monthcollected']).groupby(['fieldnumber'])
-    animal_tracks: List[pd.DataFrame] = []
+    # per-animal constants come from the first row of each animal in the incoming order
+    constants = df.drop_duplicates('fieldnumber').set_index('fieldnumber')
 
-    for name, df_group in tqdm(grouped_df, desc="Animal Daily Position"):
-        gdf = df_group.set_index('datecollected')
+    # time order within each animal so the daily means sum in the same order a per-animal resample would
+    df = df.sort_values(['fieldnumber', 'datecollected'], kind='stable')
+    fieldnumbers = df['fieldnumber'].astype('category')
 
-        assign_vals = {
-            'fieldnumber': name[0],
-            'commonname': gdf.iloc[0].at['commonname'],
-            'scientificname': gdf.iloc[0].at['scientificname'],
-            'aphiaid': gdf.iloc[0].at['aphiaid']
-        }
+    # average the location of each animal's days, drop days without a full position
+    daily = df.groupby(
+        [fieldnumbers.cat.codes.rename('animal'), df['datecollected'].dt.floor('D')],
+        sort=True
+    )[['latitude', 'longitude']].mean().dropna().reset_index()
 
-        # resample on days, average the location of that day, drop empty days
-        gdf = gdf.resample('D').mean(numeric_only=True).dropna().assign(**assign_vals)
+    constants = constants.reindex(fieldnumbers.cat.categories)
+    constants = pd.DataFrame({
+        'aphiaid': constants['aphiaid'].to_numpy(),
+        'fieldnumber': np.asarray(fieldnumbers.cat.categories, dtype=object),
+        'commonname': np.asarray(constants['commonname'], dtype=object),
+        'scientificname': np.asarray(constants['scientificname'], dtype=object),
+    })
 
-        add_dfs = []
+    return daily, constants
 
-        # concat them all into one dataframe
-        full_gdf = pd.concat([
-            gdf,
-            *add_dfs
-        ]).sort_index().rename_axis('datecollected')
 
-        animal_tracks.append(full_gdf)
+def _animal_tracks_to_gdf(tracks: pd.DataFrame, constants: pd.DataFrame) -> geopandas.GeoDataFrame:
+    """
+    Broadcasts per-animal constants onto (animal, datecollected, latitude, longitude) rows and turns them into
+    point geometries indexed by month.
+    """
+    animal = tracks['animal'].to_numpy()
 
-    full_animal_tracks = pd.concat(animal_tracks)
+    full_animal_tracks = pd.DataFrame({
+        'datecollected': tracks['datecollected'].to_numpy(),
+        'latitude': tracks['latitude'].to_numpy(),
+        'longitude': tracks['longitude'].to_numpy(),
+        **{c: constants[c].to_numpy()[animal] for c in ['aphiaid', 'fieldnumber', 'commonname', 'scientificname']}
+    })
 
-    # restore monthlycollected for all points - the synethsized points didn't have them
-    full_animal_tracks['monthcollected'] = full_animal_tracks.index.month
+    # restore monthlycollected for all points
+    full_animal_tracks['monthcollected'] = full_animal_tracks['datecollected'].dt.month.to_numpy()
 
     # turn into a gdf
     full_animal_daily_pos = geopandas.GeoDataFrame(full_animal_tracks, geometry=geopandas.points_from_xy(full_animal_tracks.longitude, full_animal_tracks.latitude))
-    full_animal_daily_pos.reset_index(inplace=True)
     full_animal_daily_pos.set_index('monthcollected', inplace=True)
 
-    return full_animal_daily_pos 
+    return full_animal_daily_pos
+
+
+def _load_routing(interp_method: Optional[str]=None):
+    """
+    Builds or loads the routing graph an interpolation method needs, so pool workers forked afterwards inherit it.
+    """
+    if interp_method == 'visgraph':
+        build_vis_graph()
+    elif interp_method == 'grid':
+        build_water_grid()
+
+
+def _shard_animals(df: pd.DataFrame, shards: int) -> List[pd.DataFrame]:
+    """
+    Splits detections into contiguous runs of animals, in the order aggregation sorts them, with roughly equal row counts.
+    """
+    codes = df['fieldnumber'].astype('category').cat.codes.to_numpy()
+    counts = np.bincount(codes)
+
+    # shard each animal by where its rows start in the sorted order
+    shard_of_animal = np.minimum((np.cumsum(counts) - counts) * shards // counts.sum(), shards - 1)
+    row_shards = shard_of_animal[codes]
+
+    return [df[row_shards == i] for i in np.unique(shard_of_animal)]
+
+
+def _by_animal_shards(agg: Callable[..., geopandas.GeoDataFrame], df: pd.DataFrame, workers: Optional[int], **kwargs) -> Optional[geopandas.GeoDataFrame]:
+    """
+    Runs a per-animal aggregation over shards of animals in a pool of workers (default CONFIG.agg_workers) and
+    stitches the results back together in order.
+
+    The pool is billiard's, which unlike multiprocessing's can be started from inside a daemonic celery prefork
+    worker.  Its workers are forked after any routing graph is loaded, and share it.  Returns None when the
+    aggregation should just run in this process: one worker or one animal.
+    """
+    workers = CONFIG.agg_workers if workers is None else workers
+    if workers <= 1 or df['fieldnumber'].nunique() <= 1:
+        return None
+
+    shards = _shard_animals(df, workers * 4)
+    logger.info("_by_animal_shards: %s over %d shards on %d workers", agg.__name__, len(shards), workers)
+
+    # once, here, rather than in every worker: on a cold cache they would all build it at once
+    _load_routing(kwargs.get('interp_method'))
+
+    with Pool(processes=workers) as pool:
+        # one job per shard rather than pool.map: billiard only credits a map's results to the first worker that
+        # picked up a chunk, so the others sit out its 30s message-consumption wait when the pool shuts down
+        pending = [pool.apply_async(agg, (shard,), dict(workers=1, **kwargs)) for shard in shards]
+        results = [p.get() for p in pending]
+
+    return pd.concat(results)
+
+
+def daily_avg(df: pd.DataFrame, workers: Optional[int]=None) -> geopandas.GeoDataFrame:
+    """
+    For each animal, average its position over each day it was detected.
+
+    @param  workers     Processes to shard animals over, defaults to CONFIG.agg_workers.
+    """
+    sharded = _by_animal_shards(daily_avg, df, workers)
+    if sharded is not None:
+        return sharded
+
+    return _animal_tracks_to_gdf(*_daily_positions(df))
 
 
 def bounding_boxes(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     """
     Creates bounding boxes for each animal over a monthly timeframe.
     """
-    df_bb = df.groupby(['fieldnumber', 'monthcollected']).agg(['min', 'max']).reset_index(0)
+    # only the coordinates: names come out of the store as unordered categoricals, which have no min or max
+    df_bb = df.groupby(['fieldnumber', 'monthcollected'], observed=True)[['latitude', 'longitude']].agg(['min', 'max']).reset_index(0)
     # df_bb = df_bb[['monthcollected', 'fieldnumber', 'geometry']]
     boxes=df_bb.apply(lambda rec: box(rec.longitude['min'], rec.latitude['min'], rec.longitude['max'], rec.latitude['max']), axis=1)
 
@@ -148,7 +253,7 @@ def animal_boxes(df: pd.DataFrame) -> geopandas.GeoDataFrame:
         poly = geopandas.points_from_xy(nodupes.longitude, nodupes.latitude).unary_union().convex_hull #.minimum_rotated_rectangle
         return poly
 
-    grouped_df = df.drop(columns=['datecollected', 'weekcollected']).groupby(['fieldnumber', 'monthcollected'])
+    grouped_df = df.drop(columns=['datecollected', 'weekcollected']).groupby(['fieldnumber', 'monthcollected'], observed=True)
     xformed = grouped_df.apply(custom)
 
     new_df = pd.DataFrame(xformed, columns=['geom']).reset_index(0)
@@ -157,127 +262,192 @@ def animal_boxes(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     return gdf
 
 
+@cache
+def get_path_cache_key(method: str='visgraph') -> str:
+    """
+    Redis hash holding memoized shortest paths of a routing method, keyed by their rounded endpoints.
+
+    Routes are namespaced by the graph or grid they were computed on.  Worked out once per process, naming the vis
+    graph hashes the land polygons.
+    """
+    if method == 'grid':
+        return f"grid:{build_water_grid().name}:paths"
+
+    return f"visgraph:{get_vis_graph_path().stem}:paths"
+
+
+@lru_cache(maxsize=CONFIG.path_cache_size)
+def get_shortest_path(lon_start: float, lat_start: float, lon_end: float, lat_end: float, method: str='visgraph') -> Tuple[Tuple[float, float], ...]:
+    """
+    Shortest water path between two points, as a tuple of (lon, lat) vertices including both endpoints.
+
+    Routes around the land visibility graph ('visgraph') or across the water grid ('grid').  Memoized in process
+    and in redis, so a route between two receivers is computed once for all animals, years, projects and workers.
+    Callers should round the endpoints (CONFIG.path_cache_decimals) so nearby detections share routes.
+    """
+    field = f"{lon_start},{lat_start},{lon_end},{lat_end}"
+
+    cached = r.hget(get_path_cache_key(method), field)
+    if cached:
+        return tuple(tuple(c) for c in json.loads(cached))
+
+    if method == 'grid':
+        path = build_water_grid().shortest_path(lon_start, lat_start, lon_end, lat_end)
+    else:
+        g = build_vis_graph()
+        vg_line = g.shortest_path(
+            vg.Point(lon_start, lat_start),
+            vg.Point(lon_end, lat_end)
+        )
+        path = tuple((p.x, p.y) for p in vg_line)
+
+    r.hset(get_path_cache_key(method), field, json.dumps(path))
+
+    return path
+
+
 def get_interp_line(lon_start: float, lat_start: float, lon_end: float, lat_end: float, method: str='visgraph') -> LineString:
     """
     Creates a line from start to end.
+
+    'simple' is a straight line, 'visgraph' and 'grid' route around land (see get_shortest_path).
     """
     if method == 'simple':
         return LineString([
             (lon_start, lat_start),
             (lon_end, lat_end)
         ])
-    elif method == 'visgraph':
-        g = build_vis_graph()
-        vg_line = g.shortest_path(
-            vg.Point(lon_start, lat_start),
-            vg.Point(lon_end, lat_end)
-        )
+    elif method in ('visgraph', 'grid'):
+        start = (round(float(lon_start), CONFIG.path_cache_decimals), round(float(lat_start), CONFIG.path_cache_decimals))
+        end = (round(float(lon_end), CONFIG.path_cache_decimals), round(float(lat_end), CONFIG.path_cache_decimals))
 
-        # translate into shapely linestring
+        # paths are symmetric, only route (and memoize) one direction of each pair
+        if end < start:
+            path = get_shortest_path(*end, *start, method=method)[::-1]
+        else:
+            path = get_shortest_path(*start, *end, method=method)
+
+        # routing is done between the rounded endpoints, put the exact ones back
         return LineString([
-            (p.x, p.y) for p in vg_line
+            (lon_start, lat_start),
+            *path[1:-1],
+            (lon_end, lat_end)
         ])
 
     raise ValueError(f"Unknown method ({method}) for get_interp_line")
 
 
-def animal_interpolated_paths(df: pd.DataFrame, interp_method: str="visgraph", max_day_gap: int=15) -> geopandas.GeoDataFrame:
+def animal_interpolated_paths(df: pd.DataFrame, interp_method: str="visgraph", max_day_gap: int=15, workers: Optional[int]=None) -> geopandas.GeoDataFrame:
     """
     For each animal, interpolate the path between detections (daily).
-    """
-    grouped_df = df.drop(columns=['weekcollected', 'monthcollected']).groupby(['fieldnumber'])
-    animal_tracks: List[pd.DataFrame] = []
 
-    for name, df_group in tqdm(grouped_df, desc="Animal Daily Position"):
-        gdf = df_group.set_index('datecollected')
+    Gaps of more than one and less than max_day_gap days between an animal's daily positions are filled with one
+    point per missing day, evenly spaced along the path from the day before the gap to the day after it.  All gaps
+    of all animals are filled in bulk: each distinct path is built once and every missing day is placed on its path
+    in a single vectorized interpolation.
 
-        assign_vals = {
-            'fieldnumber': name[0],
-            'commonname': gdf.iloc[0].at['commonname'],
-            'scientificname': gdf.iloc[0].at['scientificname'],
-            'aphiaid': gdf.iloc[0].at['aphiaid']
-        }
+    @param  workers     Processes to shard animals over, defaults to CONFIG.agg_workers.  Worth it when many distinct
+                        paths have to be routed.
+    """
+    sharded = _by_animal_shards(animal_interpolated_paths, df, workers, interp_method=interp_method, max_day_gap=max_day_gap)
+    if sharded is not None:
+        return sharded
 
-        # resample on days, average the location of that day, drop empty days
-        gdf = gdf.resample('D').mean(numeric_only=True).dropna().assign(**assign_vals)
+    daily, constants = _daily_positions(df)
 
-        # determine gaps in days
-        diffs = gdf.index.to_series().diff().apply(lambda x: x.days)    # first row is always NaT
+    animal = daily['animal'].to_numpy()
+    days = daily['datecollected'].to_numpy()
+    lons = daily['longitude'].to_numpy()
+    lats = daily['latitude'].to_numpy()
 
-        # get all location indicies that match the days we have to fill in
-        end_idxs = [i for i, v in enumerate(diffs.between(1.0, float(max_day_gap), inclusive='neither').to_list()) if v]
+    # determine gaps in days - a gap ends at each daily position of the same animal the right distance after the previous
+    day_diffs = np.diff(days) // np.timedelta64(1, 'D')
+    end_idxs = np.flatnonzero((animal[1:] == animal[:-1]) & (day_diffs > 1) & (day_diffs < max_day_gap)) + 1
+    begin_idxs = end_idxs - 1
+    gap_days = day_diffs[begin_idxs]
 
-        # end idxs refers to the integer-location based index of the END of the date range
-        # the beginning of the date range is the index directly before it
-        add_dfs = []
+    # one row per missing day: the gap it belongs to and how many days into the gap it is
+    missing = gap_days - 1
+    gap = np.repeat(np.arange(len(end_idxs)), missing)
+    step = np.arange(missing.sum()) - np.repeat(np.cumsum(missing) - missing, missing) + 1
+    fraction = step / gap_days[gap]
 
-        for i, end_idx in enumerate(tqdm(end_idxs, desc="Filling gaps")):
-            begin = gdf.iloc[end_idx - 1]
-            end = gdf.iloc[end_idx]
+    interp_lons = lons[begin_idxs][gap]
+    interp_lats = lats[begin_idxs][gap]
 
-            # create a date range, daily
-            date_range = pd.date_range(begin.name, end.name, freq='D')
+    # if the begin and end is the same, there's no line, and no need to interpolate
+    moving = ~(np.isclose(lons[begin_idxs], lons[end_idxs]) & np.isclose(lats[begin_idxs], lats[end_idxs]))
 
-            # if the begin and end is the same, there's no line, and no need to interpolate
-            if np.isclose(begin.longitude, end.longitude) and np.isclose(begin.latitude, end.latitude):
-                interp_df = pd.DataFrame({
-                    'longitude': [begin.longitude] * (len(date_range) - 2),
-                    'latitude': [begin.latitude] * (len(date_range) - 2),
-                }, index=date_range[1:-1]).assign(**assign_vals)
+    if moving.any():
+        # make a path between each distinct begin and end, shared by every gap with those endpoints
+        endpoints = np.column_stack([lons[begin_idxs], lats[begin_idxs], lons[end_idxs], lats[end_idxs]])[moving]
+        unique_endpoints, path_idx = np.unique(endpoints, axis=0, return_inverse=True)
 
-                add_dfs.append(interp_df)
-                continue
+        lines = np.empty(len(unique_endpoints), dtype=object)
+        for i, (lon_start, lat_start, lon_end, lat_end) in enumerate(tqdm(unique_endpoints, desc="Filling gaps")):
+            lines[i] = get_interp_line(lon_start, lat_start, lon_end, lat_end, method=interp_method)
 
-            # make a path between the begin and end
-            line = get_interp_line(begin.longitude, begin.latitude, end.longitude, end.latitude, method=interp_method)
+        # place every missing day of every moving gap on its path at once
+        gap_lines = np.full(len(end_idxs), None, dtype=object)
+        gap_lines[moving] = lines[path_idx.ravel()]
 
-            # normalize that date range so we can feed data to the linestring interpolate
-            # https://stackoverflow.com/a/41532180
-            normalized_dates = (date_range - date_range.min()) / (date_range.max() - date_range.min())
+        on_path = moving[gap]
+        interp_points = shapely.line_interpolate_point(gap_lines[gap[on_path]], fraction[on_path], normalized=True)
+        interp_lons[on_path] = shapely.get_x(interp_points)
+        interp_lats[on_path] = shapely.get_y(interp_points)
 
-            # skipping the beginning and end, interpolate over the line, transforming into a dataframe
-            interp_points = [list(line.interpolate(nd, normalized=True).coords)[0] for nd in normalized_dates[1:-1]]
-            interp_lons, interp_lats = zip(*interp_points)
+    # combine the daily positions and the gap fills into one time ordered track per animal
+    interp_animal = animal[begin_idxs][gap]
+    interp_days = days[begin_idxs][gap] + step * np.timedelta64(1, 'D')
 
-            interp_df = pd.DataFrame({
-                'longitude': interp_lons,
-                'latitude': interp_lats,
-            }, index=date_range[1:-1]).assign(**assign_vals)
+    all_animal = np.concatenate([animal, interp_animal])
+    all_days = np.concatenate([days, interp_days])
+    order = np.lexsort((all_days, all_animal))
 
-            add_dfs.append(interp_df)
+    full_animal_tracks = pd.DataFrame({
+        'animal': all_animal[order],
+        'datecollected': all_days[order],
+        'latitude': np.concatenate([lats, interp_lats])[order],
+        'longitude': np.concatenate([lons, interp_lons])[order],
+    })
 
-        # concat them all into one dataframe
-        full_gdf = pd.concat([
-            gdf,
-            *add_dfs
-        ]).sort_index().rename_axis('datecollected')
+    return _animal_tracks_to_gdf(full_animal_tracks, constants)
 
-        animal_tracks.append(full_gdf)
 
-    full_animal_tracks = pd.concat(animal_tracks)
+def get_vis_graph_path(filename: str="data/secoora-land.geojson", simplify: Optional[float]=None) -> Path:
+    """
+    On-disk cache location of a visibility graph, named by a hash of the land polygons and build parameters so a new
+    coastline or simplification never reuses a stale graph.
 
-    # restore monthlycollected for all points - the synethsized points didn't have them
-    full_animal_tracks['monthcollected'] = full_animal_tracks.index.month
+    @param  simplify    Land simplification tolerance, defaults to CONFIG.visgraph_simplify.
+    """
+    simplify = CONFIG.visgraph_simplify if simplify is None else simplify
 
-    # turn into a gdf
-    full_animal_daily_pos = geopandas.GeoDataFrame(full_animal_tracks, geometry=geopandas.points_from_xy(full_animal_tracks.longitude, full_animal_tracks.latitude))
-    full_animal_daily_pos.reset_index(inplace=True)
-    full_animal_daily_pos.set_index('monthcollected', inplace=True)
+    h = hashlib.sha256(Path(filename).read_bytes())
+    h.update(repr(simplify).encode('utf-8'))
 
-    return full_animal_daily_pos
+    return Path(CONFIG.data_dir) / Path(f"landvisgraph-{h.hexdigest()[:16]}.pk1")
 
 
 @cache
-def build_vis_graph(filename: str=None) -> vg.VisGraph:
-    saved = Path(CONFIG.data_dir) / Path('landvisgraph.pk1')
+def build_vis_graph(filename: str="data/secoora-land.geojson", simplify: Optional[float]=None) -> vg.VisGraph:
+    """
+    Loads the visibility graph around the land polygons, building and caching it on disk first if needed.
+
+    Builds over CONFIG.visgraph_workers processes (all cores by default), or in process when already running in a
+    daemonic worker that can't start its own pool.
+
+    @param  simplify    Tolerance (degrees) the land polygons are simplified to before building, which cuts the
+                        vertex count driving build time and per-query cost.  Defaults to CONFIG.visgraph_simplify.
+    """
+    simplify = CONFIG.visgraph_simplify if simplify is None else simplify
+
+    saved = get_vis_graph_path(filename, simplify)
     if saved.exists():
         g = vg.VisGraph()
         g.load(str(saved))
         return g
 
-    if not filename:
-        filename = "data/secoora-land.geojson"
-
     with open(filename) as f:
         gj = geojson.load(f)
 
@@ -285,21 +455,78 @@ def build_vis_graph(filename: str=None) -> vg.VisGraph:
     for polygon_outer in gj.geometry.coordinates:
         assert len(polygon_outer) == 1      # no inner rings
 
+        ring = polygon_outer[0]
+        if simplify:
+            simplified = Polygon(ring).simplify(simplify, preserve_topology=True)
+            if simplified.is_empty:
+                continue
+            ring = simplified.exterior.coords
+
         polys.append(
-            [vg.Point(*c) for c in polygon_outer[0]]
+            [vg.Point(*c) for c in ring]
         )
 
+    workers = CONFIG.visgraph_workers or os.cpu_count() or 1
+    if multiprocessing.current_process().daemon:
+        workers = 1
+
+    logger.info("build_vis_graph: building %s from %d land vertices on %d workers", saved, sum(len(p) for p in polys), workers)
+
     g = vg.VisGraph()
-    g.build(polys, workers=1)
+    g.build(polys, workers=workers)
+
+    # other workers may be loading it already
+    with replacing(saved) as tmp:
+        g.save(str(tmp))
 
-    g.save(str(saved))
     return g
 
 
+def get_grid_lattice(bounds, resolution=1) -> Tuple[float, float, int, int, int, int]:
+    """
+    Snaps a grid around bounds (padded by a degree on every side) to the global lattice of cells for a resolution.
+
+    Cells are resolution km on a side at the equator, and cell (i, j) has its lower left corner at (i * dx, j * dy).
+    Returns (dx, dy, first column, first row, columns, rows), so nearby extents share a grid.
+    """
+    dx = resolution / 111.32
+    dy = resolution / 110.57
+
+    ix0 = math.floor((bounds[0] - 1) / dx)
+    iy0 = math.floor((bounds[1] - 1) / dy)
+    n_x = math.ceil((bounds[2] + 1) / dx) - ix0
+    n_y = math.ceil((bounds[3] + 1) / dy) - iy0
+
+    return dx, dy, ix0, iy0, n_x, n_y
+
+
+@lru_cache(maxsize=8)
+def _lattice_gridsquares(resolution, ix0: int, iy0: int, n_x: int, n_y: int) -> Tuple[geopandas.GeoDataFrame, geopandas.GeoDataFrame]:
+    """
+    Cell boxes and centroids of a block of the global lattice, longitude major, latitude minor.
+    """
+    dx, dy, *_ = get_grid_lattice((0, 0, 0, 0), resolution)
+
+    x, y = np.meshgrid((ix0 + np.arange(n_x)) * dx, (iy0 + np.arange(n_y)) * dy, indexing='ij')
+    x, y = x.ravel(), y.ravel()
+
+    gp_grid = geopandas.GeoDataFrame(
+        geometry=GeometryArray(shapely.box(x, y, x + dx, y + dy)),
+        crs='EPSG:4326'
+    )
+
+    p_grid = geopandas.GeoDataFrame(geometry=GeometryArray(shapely.points(x + dx / 2, y + dy / 2)), crs='EPSG:4326')
+    p_grid['lat'] = y + dy / 2
+    p_grid['lon'] = x + dx / 2
+
+    return gp_grid, p_grid
+
+
 # https://github.com/adaj/geohunter/blob/65c65a451f1edaa110de5629e4a3fa9c1cbaa50b/geohunter/util.py#L137-L169
-@cache
 def make_gridsquares(bounds, resolution=1) -> Tuple[geopandas.GeoDataFrame, geopandas.GeoDataFrame]:
     """It constructs a grid of square cells.
+    The grid covers bounds padded by a degree and is snapped to a global lattice (see get_grid_lattice), so it
+    is only built once per process for a resolution and extent.
     Parameters
     ----------
     bounds : 
@@ -307,37 +534,10 @@ def make_gridsquares(bounds, resolution=1) -> Tuple[geopandas.GeoDataFrame, geop
     resolution : float, default is 1.
         Space between the square cells.
     """
-    x0 = bounds[0] - 1
-    xf = bounds[2] + 1
-    y0 = bounds[1] - 1
-    yf = bounds[3] + 1
-    n_y = int((yf-y0)/(resolution/110.57))
-    n_x = int((xf-x0)/(resolution/111.32))
-    grid = {}
-    c = 0
-    for i in range(n_x):
-        for j in range(n_y):
-            grid[c] = {'geometry': Polygon([[x0, y0],
-                                            [x0+(resolution/111.32), y0],
-                                            [x0+(resolution/111.32),
-                                             y0+(resolution/110.57)],
-                                            [x0, y0+(resolution/110.57)]])}
-            c += 1
-            y0 += resolution/110.57
-        y0 = bounds[1] - 1
-        x0 += resolution/111.32
-    pd_grid = pd.DataFrame(grid).transpose()
-    gp_grid = geopandas.GeoDataFrame(pd_grid, geometry='geometry',
-                            crs='EPSG:4326')
-
-    centroids = gp_grid.geometry.apply(lambda x: x.centroid)
-    p_grid = geopandas.GeoDataFrame(geometry=centroids)
-    p_grid['lat'] = centroids.y
-    p_grid['lon'] = centroids.x
+    _, _, *lattice = get_grid_lattice(bounds, resolution)
+    gp_grid, p_grid = _lattice_gridsquares(resolution, *lattice)
 
-    return gp_grid, p_grid
-    #grid = geopandas.sjoin(grid, city_shape, op='intersects')
-    #return grid[~grid.index.duplicated()]
+    return gp_grid.copy(), p_grid.copy()
 
 
 # https://github.com/adaj/geohunter/blob/65c65a451f1edaa110de5629e4a3fa9c1cbaa50b/geohunter/util.py#L21
@@ -412,21 +612,82 @@ def _match_with_grid_kde(animal_gdf: geopandas.GeoDataFrame, bounds, resolution:
     return joined
 
 
-def make_contour_polygons(gdf: geopandas.GeoDataFrame, levels: Sequence[Union[int, float]], level_adjust: float=0.0, range_low: float=-math.inf, range_high: float=math.inf) -> List[Feature]:
+def _rasterize_track_counts(tracks: geopandas.GeoDataFrame, bounds, resolution: int=10) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
     """
-    Creates a contour filled polygon Feature per level.
+    Counts the tracks of each project that touch each cell of the grid make_gridsquares builds for bounds, by walking
+    every track segment over the cell lattice instead of joining geometries.
 
-    @param gdf  GeoDataFrame of a grid of points, ordered by longitude major, latitude minor.
+    A segment touches the cells between the points where it crosses cell edges; a point or single position track
+    touches the cell it is in.  Each track counts once per cell.
+
+    Returns the counts as a [project, longitude, latitude] array, the longitudes and latitudes of the cell centers,
+    and the project codes.
     """
-    # set normalized range for percent calcs
-    min_level = min(levels)
-    max_level = max(levels)
-    def calc_pct(val, minl=min_level, maxl=max_level):
-        try:
-            return (val - minl) / (maxl - minl)
-        except ZeroDivisionError:
-            return 0.
+    dx, dy, ix0, iy0, n_x, n_y = get_grid_lattice(bounds, resolution)
+    n_cells = n_x * n_y
+
+    coords, track = shapely.get_coordinates(np.asarray(tracks.geometry.values), return_index=True)
+    u = coords[:, 0] / dx - ix0
+    v = coords[:, 1] / dy - iy0
+
+    # segments between consecutive vertices of the same track
+    same = track[1:] == track[:-1]
+    seg_track = track[:-1][same]
+    u0, v0, u1, v1 = u[:-1][same], v[:-1][same], u[1:][same], v[1:][same]
+
+    def edge_crossings(a0: np.ndarray, a1: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Segment ids and fractions along each segment at every cell edge it crosses along one axis.
+        """
+        lo = np.floor(np.minimum(a0, a1))
+        n = (np.floor(np.maximum(a0, a1)) - lo).astype(np.int64)
+
+        seg = np.repeat(np.arange(len(a0)), n)
+        edge = np.repeat(lo, n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + 1
+        return seg, (edge - a0[seg]) / (a1[seg] - a0[seg])
+
+    seg_u, t_u = edge_crossings(u0, u1)
+    seg_v, t_v = edge_crossings(v0, v1)
+
+    segs = np.arange(len(seg_track))
+    seg = np.concatenate([segs, segs, seg_u, seg_v])
+    t = np.concatenate([np.zeros(len(segs)), np.ones(len(segs)), t_u, t_v])
+    order = np.lexsort((t, seg))
+    seg, t = seg[order], t[order]
+
+    # the middle of each stretch between crossings lies inside exactly one cell
+    inner = seg[1:] == seg[:-1]
+    mid_seg = seg[:-1][inner]
+    mid = (t[:-1][inner] + t[1:][inner]) / 2
+    cell_u = np.concatenate([u, u0[mid_seg] + mid * (u1[mid_seg] - u0[mid_seg])])
+    cell_v = np.concatenate([v, v0[mid_seg] + mid * (v1[mid_seg] - v0[mid_seg])])
+    cell_track = np.concatenate([track, seg_track[mid_seg]])
+
+    col = np.floor(cell_u).astype(np.int64)
+    row = np.floor(cell_v).astype(np.int64)
+    inside = (col >= 0) & (col < n_x) & (row >= 0) & (row < n_y)
+
+    # one count per track per cell, binned by project
+    track_cells = np.unique(cell_track[inside] * n_cells + col[inside] * n_y + row[inside])
+    project, project_codes = pd.factorize(tracks['project_code'])
+    counts = np.bincount(
+        project[track_cells // n_cells] * n_cells + track_cells % n_cells,
+        minlength=len(project_codes) * n_cells
+    ).reshape(len(project_codes), n_x, n_y)
+
+    lons = (ix0 + np.arange(n_x) + 0.5) * dx
+    lats = (iy0 + np.arange(n_y) + 0.5) * dy
+
+    return counts, lons, lats, list(project_codes)
+
+
+def grid_points_to_array(gdf: geopandas.GeoDataFrame) -> Tuple[np.ndarray, List[float], List[float]]:
+    """
+    Reshapes the 'counts' of a grid of points into a [latitude, longitude] array, with the longitude of each column
+    and the latitude of each row.
 
+    @param gdf  GeoDataFrame of a grid of points, ordered by longitude major, latitude minor.
+    """
     # figure out how many latitudes exist in the first column of longitudes
     lon_diffs = gdf.geometry.map(lambda p: p.x).diff()
     sig_diffs = lon_diffs[lon_diffs > 0.01]     # @TODO: prolly not good
@@ -440,14 +701,47 @@ def make_contour_polygons(gdf: geopandas.GeoDataFrame, levels: Sequence[Union[in
     lats = gdf.geometry[0:num_lats].apply(lambda p: p.y).tolist()
     lons = gdf.geometry[::num_lats].apply(lambda p: p.x).tolist()
 
-    # set up interpolators to convert from image space back into lat/lon space
-    interp_x = interp1d(np.arange(0, num_lons), lons)
-    interp_y = interp1d(np.arange(0, num_lats), lats)
-
     # now extract count data and massage it into a 2d array
     split_counts = np.split(gdf['counts'].to_numpy(), num_lons)
     bits = np.stack(split_counts).transpose()       # go from lon major to lat major. makes far more sense in my head
 
+    return bits, lons, lats
+
+
+def make_contour_polygons(gdf: geopandas.GeoDataFrame, levels: Sequence[Union[int, float]], level_adjust: float=0.0, range_low: float=-math.inf, range_high: float=math.inf) -> List[Feature]:
+    """
+    Creates a contour filled polygon Feature per level.
+
+    @param gdf  GeoDataFrame of a grid of points, ordered by longitude major, latitude minor.
+    """
+    bits, lons, lats = grid_points_to_array(gdf)
+
+    return make_grid_contour_polygons(bits, lons, lats, levels, level_adjust=level_adjust, range_low=range_low, range_high=range_high)
+
+
+def make_grid_contour_polygons(bits: np.ndarray, lons: Sequence[float], lats: Sequence[float], levels: Sequence[Union[int, float]], level_adjust: float=0.0, range_low: float=-math.inf, range_high: float=math.inf) -> List[Feature]:
+    """
+    Creates a contour filled polygon Feature per level from a 2d array of counts.
+
+    @param bits     [latitude, longitude] array of values to contour.
+    @param lons     Longitude of each column of bits.
+    @param lats     Latitude of each row of bits.
+    """
+    # set normalized range for percent calcs
+    min_level = min(levels)
+    max_level = max(levels)
+    def calc_pct(val, minl=min_level, maxl=max_level):
+        try:
+            return (val - minl) / (maxl - minl)
+        except ZeroDivisionError:
+            return 0.
+
+    num_lats, num_lons = bits.shape
+
+    # set up interpolators to convert from image space back into lat/lon space
+    interp_x = interp1d(np.arange(0, num_lons), lons)
+    interp_y = interp1d(np.arange(0, num_lats), lats)
+
     # calculate all contours
     contour_levels = []
     for level in levels:
@@ -589,6 +883,7 @@ agg_methods: Dict[str, Dict[str, Union[Callable, str]]] = {
     'daily': {
         'callable': daily_avg,
         'discrim': 'DAILY',
+        'incremental': True,
     },
     'bounding_boxes': {
         'callable': bounding_boxes,
@@ -604,16 +899,93 @@ agg_methods: Dict[str, Dict[str, Union[Callable, str]]] = {
     },
     'animal_interpolated_paths': {
         'callable': animal_interpolated_paths,
-        'discrim': 'ANIM_PATHS'
+        'discrim': 'ANIM_PATHS',
+        'incremental': True,
+    },
+    'animal_interpolated_paths_grid': {
+        'callable': partial(animal_interpolated_paths, interp_method='grid'),
+        'discrim': 'ANIM_PATHS_GRID',
+        'incremental': True,
     }
 }
+"""
+Aggregation methods.  'incremental' marks per-animal daily tracks, whose cached aggregates can be brought up to date by
+re-aggregating only the animals with new detections from their last known day on (see splice_new_detections).
+"""
+
+def _coords(gdf: Union[geopandas.GeoDataFrame, geopandas.GeoSeries]) -> np.ndarray:
+    """
+    Vertices of every geometry in a frame, as an [N,2] array of (x, y).
+    """
+    return shapely.get_coordinates(np.asarray(gdf.geometry.values))
+
+def _unique_coords(coords: np.ndarray) -> np.ndarray:
+    """
+    Distinct rows of an [N,2] array of points, sorted by x then y like a union of points orders them.
+    """
+    coords = coords[np.lexsort((coords[:, 1], coords[:, 0]))]
+    return coords[np.r_[True, (np.diff(coords, axis=0) != 0).any(axis=1)]]
+
+def convex_hull_coords(coords: np.ndarray) -> np.ndarray:
+    """
+    Vertices of the convex hull of an [N,2] array of points, without collinear ones.
+
+    Ordered like GEOS orders a hull: clockwise, starting from the lowest (then leftmost) vertex.  Points that don't span
+    an area give their one or two extreme points.
+    """
+    if len(coords) >= 3:
+        try:
+            vertices = coords[ConvexHull(coords).vertices[::-1]]
+            first = np.lexsort((vertices[:, 0], vertices[:, 1]))[0]
+            return np.roll(vertices, -first, axis=0)
+        except QhullError:
+            pass
+
+    order = np.lexsort((coords[:, 1], coords[:, 0]))
+    return _unique_coords(coords[order[[0, -1]]])
+
+def hull_geometry(vertices: np.ndarray) -> BaseGeometry:
+    """
+    Point, LineString or Polygon through hull vertices, matching what shapely's convex_hull gives for them.
+    """
+    if len(vertices) == 1:
+        return Point(vertices[0])
+    if len(vertices) == 2:
+        return LineString(vertices)
+
+    return Polygon(vertices)
+
+def minimum_rotated_rectangle(vertices: np.ndarray) -> BaseGeometry:
+    """
+    Smallest area rectangle around convex hull vertices, which has a side along one of the hull's edges.
+    """
+    if len(vertices) < 3:
+        return hull_geometry(vertices)
+
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    along = edges / np.hypot(edges[:, 0], edges[:, 1])[:, np.newaxis]
+    across = np.column_stack([-along[:, 1], along[:, 0]])
+
+    # extent of the hull along and across every edge direction
+    u = vertices @ along.T
+    v = vertices @ across.T
+    u_min, u_max, v_min, v_max = u.min(axis=0), u.max(axis=0), v.min(axis=0), v.max(axis=0)
+
+    i = np.argmin((u_max - u_min) * (v_max - v_min))
+    corners = [(u_min[i], v_min[i]), (u_max[i], v_min[i]), (u_max[i], v_max[i]), (u_min[i], v_max[i])]
+
+    return Polygon([cu * along[i] + cv * across[i] for cu, cv in corners])
 
 def summary_raw(gdf: geopandas.GeoDataFrame, **kwargs) -> BaseGeometry:
     #return FeatureCollection([gi for gi in gdf.geometry])
-    return geopandas.GeoSeries([gdf.unary_union])
+    if (shapely.get_type_id(np.asarray(gdf.geometry.values)) != shapely.GeometryType.POINT).any():
+        return geopandas.GeoSeries([gdf.unary_union])
+
+    coords = _unique_coords(_coords(gdf))
+    return geopandas.GeoSeries([Point(coords[0]) if len(coords) == 1 else shapely.multipoints(coords)])
 
 def summary_convex(gdf: geopandas.GeoDataFrame, **kwargs) -> geopandas.GeoDataFrame:
-    convex_hull = gdf.unary_union.convex_hull
+    convex_hull = hull_geometry(convex_hull_coords(_coords(gdf)))
     if isinstance(convex_hull, Polygon):
         convex_hull = smooth_polygon(convex_hull)
     feat = buffer_union(Feature(
@@ -623,15 +995,32 @@ def summary_convex(gdf: geopandas.GeoDataFrame, **kwargs) -> geopandas.GeoDataFr
     hull = geopandas.GeoDataFrame.from_features([feat])
     return hull
 
-def summary_concave(gdf: geopandas.GeoDataFrame, **kwargs) -> geopandas.GeoDataFrame:
-    logger.info("Calculating concave hull")
-    month_df_points = np.unique(np.stack(
+def _unique_positions(gdf: geopandas.GeoDataFrame) -> np.ndarray:
+    """
+    Distinct (longitude, latitude) pairs of a frame of positions, as an [N,2] array.
+    """
+    return np.unique(np.stack(
         (
             gdf['longitude'].to_numpy(),
             gdf['latitude'].to_numpy()
         ),
         axis=1
     ), axis=0)
+
+def _buffered_hull(geom: Polygon) -> geopandas.GeoDataFrame:
+    """
+    Turns a lon/lat hull into a range layer: buffered by 1km, smoothed, and cleaned up into a single level 1 feature.
+    """
+    buffered_geom = ConcaveHull.buffer_in_meters(geom, 1000)
+    feat = buffer_union(Feature(
+        smooth_polygon(buffered_geom),
+        {'level': 1}
+    ))
+    return geopandas.GeoDataFrame.from_features([feat])
+
+def summary_concave(gdf: geopandas.GeoDataFrame, **kwargs) -> geopandas.GeoDataFrame:
+    logger.info("Calculating concave hull")
+    month_df_points = _unique_positions(gdf)
     hullobj = ConcaveHull(month_df_points)
     if hullobj is not None:
         try:
@@ -642,12 +1031,7 @@ def summary_concave(gdf: geopandas.GeoDataFrame, **kwargs) -> geopandas.GeoDataF
 
                 # if the hull is busted, intentionally trigger an error to let it do convex below
                 _ = geom.area
-                buffered_geom = hullobj.buffer_in_meters(geom, 1000)
-                feat = buffer_union(Feature(
-                    smooth_polygon(buffered_geom),
-                    {'level': 1}
-                ))
-                return geopandas.GeoDataFrame.from_features([feat])
+                return _buffered_hull(geom)
         except AttributeError as e:
             logger.warning("summary_concave: ConcaveHull broke: %s", str(e))
         except TypeError:
@@ -657,11 +1041,28 @@ def summary_concave(gdf: geopandas.GeoDataFrame, **kwargs) -> geopandas.GeoDataF
     logger.warning("summary_concave: could not calculate concave hull, returning convex")
     return summary_convex(gdf)
 
+def summary_concave_geos(gdf: geopandas.GeoDataFrame, ratio: Optional[float]=None, **kwargs) -> geopandas.GeoDataFrame:
+    """
+    Concave hull from GEOS, which prunes the long outer edges of a Delaunay triangulation of the positions.
+
+    Post-processed like summary_concave, and falls back to the convex hull when the positions don't span an area.
+
+    @param  ratio   Concaveness between 0 (most concave) and 1 (convex hull), defaults to CONFIG.concave_hull_ratio.
+    """
+    ratio = CONFIG.concave_hull_ratio if ratio is None else ratio
+
+    hull = shapely.concave_hull(shapely.multipoints(_unique_positions(gdf)), ratio=ratio)
+    if not isinstance(hull, Polygon) or hull.is_empty:
+        logger.warning("summary_concave_geos: could not calculate concave hull, returning convex")
+        return summary_convex(gdf)
+
+    return _buffered_hull(hull)
+
 def summary_bbox(gdf: geopandas.GeoDataFrame, **kwargs) -> BaseGeometry:
     return geopandas.GeoSeries([box(*gdf.total_bounds)])
 
 def summary_rotated_bbox(gdf: geopandas.GeoDataFrame, **kwargs) -> BaseGeometry:
-    rbbox = gdf.unary_union.minimum_rotated_rectangle
+    rbbox = minimum_rotated_rectangle(convex_hull_coords(_coords(gdf)))
     return geopandas.GeoSeries([rbbox])
 
 
@@ -721,25 +1122,34 @@ def summary_distribution(gdf: geopandas.GeoDataFrame, bounds=None, range_low: fl
     all_interp_animals = pd.concat(animal_tracks, ignore_index=True)
     all_gdf = geopandas.GeoDataFrame(all_interp_animals, geometry='geometry', crs='EPSG:4326')
 
-    # make a grid, join them
-    tqdm.write("Gridding and matching animal tracks")
-    matched_gdf = _match_with_grid(all_gdf, bounds, resolution=10)
+    if CONFIG.distribution_engine == 'sjoin':
+        # make a grid, join them
+        tqdm.write("Gridding and matching animal tracks")
+        matched_gdf = _match_with_grid(all_gdf, bounds, resolution=10)
 
-    # transform to points
-    matched_gdf.geometry = matched_gdf.geometry.apply(lambda x: x.centroid)
+        # transform to points
+        matched_gdf.geometry = matched_gdf.geometry.apply(lambda x: x.centroid)
+
+        bits, lons, lats = grid_points_to_array(matched_gdf)
+    else:
+        tqdm.write("Rasterizing animal tracks")
+        counts, lons, lats, _ = _rasterize_track_counts(all_gdf, bounds, resolution=10)
+        bits = counts.sum(axis=0).T
 
     # build contour polygons
     tqdm.write("Building contour polygons")
-    level_count = int(matched_gdf['counts'].max())
+    level_count = int(bits.max())
 
     if level_count > 30:
-        _, bins = np.histogram(matched_gdf['counts'], 30)
+        _, bins = np.histogram(bits, 30)
         levels = [b+1 for b in bins]
     else:
         levels = [l for l in range(1, level_count + 1)]
 
-    contour_polys = make_contour_polygons(
-        matched_gdf,
+    contour_polys = make_grid_contour_polygons(
+        bits,
+        lons,
+        lats,
         levels=levels,
         level_adjust=-0.1,
         range_low=range_low,
@@ -806,6 +1216,11 @@ summary_methods = {
         'discrim': 'concave',
         'type': 'range'
     },
+    'concave_hull_geos': {
+        'callable': summary_concave_geos,
+        'discrim': 'concave_geos',
+        'type': 'range'
+    },
     'bbox': {
         'callable': summary_bbox,
         'discrim': 'bbox',
@@ -859,7 +1274,8 @@ class NpEncoder(json.JSONEncoder):
 @click.option("--round-decimals", type=int, default=None)
 @click.option("--to-disk/--no-to-disk", default=False)
 @click.option("--force/--no-force", default=False)
-def do_process(trackercode: str, year: str, agg_method: str, summary_method: str, month: int, buffer: float, simplify: float, jitter: float, round_decimals: int, to_disk: bool, force: bool):
+@click.option("--incremental/--no-incremental", default=False, help="Splice new detections into cached aggregates instead of recomputing them")
+def do_process(trackercode: str, year: str, agg_method: str, summary_method: str, month: int, buffer: float, simplify: float, jitter: float, round_decimals: int, to_disk: bool, force: bool, incremental: bool):
     for d in process(
         trackercode,
         year,
@@ -870,7 +1286,8 @@ def do_process(trackercode: str, year: str, agg_method: str, summary_method: str
         simplify=simplify,
         jitter=jitter,
         round_decimals=round_decimals,
-        force=force
+        force=force,
+        incremental=incremental
     ):
         if to_disk:
             fname = Path('out2') / Path("-".join((str(v)[0:4] for k, v in d['_metadata'].items())) + ".geojson")
@@ -880,9 +1297,100 @@ def do_process(trackercode: str, year: str, agg_method: str, summary_method: str
         else:
             print(d)
 
-def process(trackercode: str, year: Optional[str], agg_method: str, summary_method: str, month: Optional[int]=None, buffer: Optional[float]=None, simplify: Optional[float]=None, jitter: Optional[float]=None, round_decimals: Optional[int]=None, force: bool=False) -> Sequence[Dict[str, Any]]:
+def get_agg_hwm_path(cache_path: Path) -> Path:
+    """
+    Sidecar file holding the detection high-water mark an aggregate cache was computed up to.
+    """
+    return cache_path.with_suffix('.hwm.json')
+
+
+HWM_HASH_COLUMNS = ['fieldnumber', 'datecollected', 'latitude', 'longitude']
+"""Detection columns whose contents a high-water mark fingerprints."""
+
+
+def _hash_detections(df: pd.DataFrame) -> str:
+    """
+    Order independent fingerprint of a set of detections: the wrapping sum of their row hashes.
+    """
+    row_hashes = pd.util.hash_pandas_object(df[HWM_HASH_COLUMNS], index=False).to_numpy()
+    return f"{int(row_hashes.sum(dtype=np.uint64)):016x}"
+
+
+def get_high_water_mark(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Latest datecollected of a set of detections, with how many there are and a fingerprint of them, so detections
+    backfilled, changed or removed at or before the mark can be noticed.
+    """
+    return {
+        'datecollected': df['datecollected'].max().isoformat() if df['datecollected'].notna().any() else None,
+        'rows': len(df),
+        'hash': _hash_detections(df),
+    }
+
+
+def is_before_high_water_mark_unchanged(df: pd.DataFrame, hwm: Dict[str, Any]) -> bool:
+    """
+    If the detections at or before a high-water mark are still exactly the ones it was taken from.
+
+    Marks written before the fingerprint existed can't tell, and count as changed.
+    """
+    if hwm.get('datecollected') is None or 'hash' not in hwm:
+        return False
+
+    before = df[df['datecollected'] <= pd.Timestamp(hwm['datecollected'])]
+    return len(before) == hwm['rows'] and _hash_detections(before) == hwm['hash']
+
+
+def splice_new_detections(gdf: geopandas.GeoDataFrame, df: pd.DataFrame, hwm: Dict[str, Optional[str]], agg_callable: Callable[[pd.DataFrame], geopandas.GeoDataFrame]) -> Optional[geopandas.GeoDataFrame]:
+    """
+    Brings a cached per-animal daily aggregate up to date with the detections past its high-water mark.
+
+    Only animals with new detections are re-aggregated, from the detection day before the earlier of their last
+    cached day and the day of their first new detection, and the result replaces those animals' cached rows from
+    that day on.  Detections at or before the mark are assumed unchanged (see is_before_high_water_mark_unchanged).
+    Returns None if there is nothing new.
+    """
+    new = df['datecollected'] > pd.Timestamp(hwm['datecollected'])
+
+    if not new.any():
+        return None
+
+    fieldnumbers = df['fieldnumber'].astype(str)
+    cached_fieldnumbers = gdf['fieldnumber'].astype(str)
+    cached_days = pd.to_datetime(gdf['datecollected'])
+
+    # re-aggregate each touched animal from its last known day, so that day's average and the gap after it are redone
+    first_new_day = df.loc[new, 'datecollected'].dt.floor('D').groupby(fieldnumbers[new]).min()
+    last_cached_day = cached_days.dt.floor('D').groupby(cached_fieldnumbers).max()
+    from_day = pd.concat([first_new_day, last_cached_day.reindex(first_new_day.index)], axis=1).min(axis=1)
+
+    # and back to the detection day before that, any gap filled up to from_day depends on the position at from_day
+    days = df['datecollected'].dt.floor('D')
+    before = days < fieldnumbers.map(from_day)
+    from_day = days[before].groupby(fieldnumbers[before]).max().reindex(from_day.index).fillna(from_day)
+
+    logger.info("splice_new_detections: %d new detections for %d animals", new.sum(), len(from_day))
+
+    fresh = agg_callable(df[df['datecollected'] >= fieldnumbers.map(from_day)])
+    kept = gdf[~(cached_days >= cached_fieldnumbers.map(from_day))]
+
+    spliced = pd.concat([kept, fresh])
+    spliced['fieldnumber'] = spliced['fieldnumber'].astype(str)
+
+    return spliced.sort_values(['fieldnumber', 'datecollected'], kind='stable')
+
+
+def process(trackercode: str, year: Optional[str], agg_method: str, summary_method: str, month: Optional[int]=None, buffer: Optional[float]=None, simplify: Optional[float]=None, jitter: Optional[float]=None, round_decimals: Optional[int]=None, force: bool=False, incremental: bool=False) -> Sequence[Dict[str, Any]]:
+    """
+    Aggregates and summarizes a project year per species.
+
+    @param  force           Reload detections from source and recompute the aggregates.
+    @param  incremental     For aggregation methods that support it, splice detections newer than a cached aggregate's
+                            high-water mark into it instead of recomputing it.
+    """
     agg_callable: Callable[[pd.DataFrame], geopandas.GeoDataFrame] = agg_methods[agg_method]['callable']
     agg_discrim: str = agg_methods[agg_method]['discrim']
+    incremental = incremental and agg_methods[agg_method].get('incremental', False)
 
     summary_callable: Callable[[geopandas.GeoDataFrame], BaseGeometry] = summary_methods[summary_method]['callable']
     summary_discrim: str = summary_methods[summary_method]['discrim']
@@ -893,7 +1401,7 @@ def process(trackercode: str, year: Optional[str], agg_method: str, summary_meth
     ret_vals: List[Dict[str, Any]] = []
 
     # group by species
-    species_groups = df.groupby(['aphiaid', 'commonname', 'scientificname'])
+    species_groups = df.groupby(['aphiaid', 'commonname', 'scientificname'], observed=True)
 
     for species_name_triple, sdf in species_groups:
         print(species_name_triple, len(sdf), file=sys.stderr)
@@ -901,13 +1409,36 @@ def process(trackercode: str, year: Optional[str], agg_method: str, summary_meth
 
         gdf: geopandas.GeoDataFrame
         cache_path = Path(CONFIG.data_dir) / Path(f"{trackercode}-{year}-{species_aphia_id}-{agg_discrim}.geojson")
+        hwm_path = get_agg_hwm_path(cache_path)
         with lock(r, str(cache_path)):
-            if cache_path.exists() and not force:
+            hwm: Optional[Dict[str, Any]] = None
+            stale = False
+            if incremental and cache_path.exists() and hwm_path.exists():
+                with hwm_path.open() as f:
+                    hwm = json.load(f)
+
+                # backfilled or edited detections behind the mark can't be spliced in, start over
+                if not is_before_high_water_mark_unchanged(sdf, hwm):
+                    print(f"> detections before the high-water mark of {str(cache_path)} changed, recomputing", file=sys.stderr)
+                    hwm = None
+                    stale = True
+
+            if cache_path.exists() and not stale and (not force or hwm is not None):
                 with cache_path.open() as f:
                     print(f"> reading from cache {str(cache_path)}", file=sys.stderr)
                     gdf = geopandas.read_file(f, driver="GeoJSON")
                     gdf['datecollected'] = gdf['datecollected'].apply(pd.to_datetime)
                     gdf.set_index('monthcollected', inplace=True)
+
+                if hwm is not None:
+                    spliced = splice_new_detections(gdf, sdf, hwm, agg_callable)
+
+                    if spliced is not None:
+                        gdf = spliced.assign(project_code=trackercode)
+                        to_disk(gdf.reset_index(), str(cache_path))
+                        with hwm_path.open('w') as f:
+                            json.dump(get_high_water_mark(sdf), f)
+                        print(f"> spliced new detections into {str(cache_path)}", file=sys.stderr)
             else:
 
                 gdf = agg_callable(sdf)
@@ -916,6 +1447,8 @@ def process(trackercode: str, year: Optional[str], agg_method: str, summary_meth
                 # cache the aggregate output for future use (combining with same species from different projects)
                 # TODO: can this go in redis somehow
                 to_disk(gdf.reset_index(), str(cache_path))
+                with hwm_path.open('w') as f:
+                    json.dump(get_high_water_mark(sdf), f)
                 print(f"> caching {str(cache_path)}", file=sys.stderr)
 
         assert gdf is not None
@@ -1091,32 +1624,39 @@ def _process_dataframe(
     return ret_vals
 
 
-def load_df(trackercode: str, year: str, trim: bool=True, jitter: Optional[float]=None, round_decimals: Optional[int]=None, extra_cols: Optional[List[str]]=None, ignore_cache: bool=False) -> geopandas.GeoSeries:
-    kwargs = {
-        'parse_dates': ['datelastmodified', 'datecollected']
-    } 
+def load_df(trackercode: str, year: str, trim: bool=True, jitter: Optional[float]=None, round_decimals: Optional[int]=None, extra_cols: Optional[List[str]]=None, ignore_cache: bool=False, compact: Optional[bool]=None) -> geopandas.GeoSeries:
+    """
+    Loads a project year of detections from the detection store, fetching it first if needed.
+
+    @param  compact     Use memory compact dtypes: categorical names, int8 month and week, and float32 coordinates
+                        when round_decimals is set.  Defaults to CONFIG.compact_dtypes.
+    """
+    compact = CONFIG.compact_dtypes if compact is None else compact
+
+    columns = None
     if trim:
-        kwargs['usecols'] = ['fieldnumber', 'latitude', 'longitude', 'datecollected', 'monthcollected', 'scientificname', 'commonname', 'aphiaid']
+        columns = list(STORE_COLUMNS)
         if extra_cols is not None:
-            kwargs['usecols'].extend(extra_cols)
-
-        kwargs['parse_dates'] = ['datecollected']
+            columns.extend(extra_cols)
 
     need = True
-    p = Path(CONFIG.data_dir) / Path(f"{trackercode}_{year}.csv")
+    p = get_store_path(trackercode, year)
     with lock(r, str(p)):
+        # carry over a CSV cache from before the parquet store existed instead of downloading again
+        if not p.exists() and convert_csv_store(p.with_suffix('.csv'), p):
+            print(f"load_df({trackercode},{year}): converted csv cache to {str(p)}", file=sys.stderr)
+
         if ignore_cache:
-            print("load_df: ignore_cache flag set, pulling from source")
+            if is_source_unchanged(trackercode, year, p):
+                print(f"load_df({trackercode},{year}): ignore_cache flag set, but source is unchanged, using cache", file=sys.stderr)
+                need = False
+            else:
+                print("load_df: ignore_cache flag set, pulling from source")
         else:
             if p.exists():
                 # verify they have the species
-                try:
-                    sdf = pd.read_csv(p, nrows=2, **kwargs)
-                    if 'aphiaid' in sdf.columns:
-                        need = False
-                except ValueError as e:
-                    if not "columns expected but not found" in str(e):
-                        raise
+                if 'aphiaid' in pq.read_schema(p).names:
+                    need = False
 
                 if need:
                     print(f"load_df({trackercode},{year}): no species info, re-loading from source", file=sys.stderr)
@@ -1127,10 +1667,7 @@ def load_df(trackercode: str, year: str, trim: bool=True, jitter: Optional[float
 
     assert p.exists()
 
-    df = pd.read_csv(p,
-        **kwargs
-    )
-    df['datecollected'] = pd.to_datetime(df['datecollected'], format='mixed')
+    df = pd.read_parquet(p, columns=columns)
     # @TODO: datelastmodified?
     df['weekcollected'] = df['datecollected'].dt.isocalendar().week
 
@@ -1138,6 +1675,17 @@ def load_df(trackercode: str, year: str, trim: bool=True, jitter: Optional[float
         df['latitude'] = df['latitude'].round(round_decimals)
         df['longitude'] = df['longitude'].round(round_decimals)
 
+    if compact:
+        df = df.astype({
+            **{c: 'category' for c in STORE_CATEGORICALS if c in df.columns},
+            'monthcollected': 'int8',
+            'weekcollected': 'int8',
+        })
+
+        # rounded coordinates don't need double precision
+        if round_decimals:
+            df = df.astype({'latitude': 'float32', 'longitude': 'float32'})
+
     return df
 
 
@@ -1148,7 +1696,7 @@ def to_gdf(df: pd.DataFrame) -> geopandas.GeoDataFrame:
     )
 
 def get_convex_hull(gdf) -> geopandas.GeoSeries:
-    hull = geopandas.GeoSeries([gdf.unary_union]).convex_hull
+    hull = geopandas.GeoSeries([hull_geometry(convex_hull_coords(_coords(gdf)))])
 
     return hull
 
@@ -1232,7 +1780,7 @@ def get_project_metadata(project_code: str, force: bool=False) -> Dict:
             return data[project_code]
 
     logger.info("get_project_metadata: retrieving metadata from OTN geoserver")
-    r = requests.get("https://members.oceantrack.org/geoserver/otn/ows?service=WFS&version=1.0.0&request=GetFeature&typeName=otn:otn_resources_metadata&outputFormat=application%2Fjson&CQL_FILTER=seriescode%20=%20%27FACT%27")
+    r = httpclient.get("https://members.oceantrack.org/geoserver/otn/ows?service=WFS&version=1.0.0&request=GetFeature&typeName=otn:otn_resources_metadata&outputFormat=application%2Fjson&CQL_FILTER=seriescode%20=%20%27FACT%27")
     r.raise_for_status()
 
     try:
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+"""Research Workspace project -> folder -> file id resolution."""
+import re
+from pprint import pformat
+from typing import Any, Dict, List, Optional, Sequence
+
+from . import httpclient
+from .cache import read_cache, write_cache
+from .config import CONFIG
+from .log import logger
+
+
+RW_ORGANIZATION_ID = 2563073
+"""RW organization that owns all FACT project workspaces."""
+
+DETECTIONS_FOLDER = "Your tag detections"
+"""Name of the folder in each project workspace that holds the detection extract zips."""
+
+
+def get_resolve_cache_key(trackercode: str) -> str:
+    """
+    Cache key for the resolved RW ids of a project.
+    """
+    return f"rw:project:{trackercode}"
+
+
+def post_graphql(query: str, variables: Dict[str, Any], caller: str) -> Dict[str, Any]:
+    """
+    Sends a query to the RW GraphQL endpoint and returns the 'data' portion of the response.
+    """
+    assert CONFIG.rw_auth_token != "you_must_set"
+
+    r = httpclient.post(
+        CONFIG.rw_gql_url,
+        json={
+            'operationName': None,
+            'query': query,
+            'variables': variables
+        },
+        headers={
+            'Authorization': f'Bearer {CONFIG.rw_auth_token}'
+        }
+    )
+
+    if r.status_code != 200:
+        raise ValueError(f"{caller} returned error ({r.status_code}):\n {pformat(r.text)}")
+
+    data = r.json()
+    if not data.get('data'):
+        raise ValueError(f"{caller} returned no data:\n {pformat(data.get('errors'))}")
+
+    return data['data']
+
+
+def _select_project(trackercode: str, all_projects: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Picks the single project node matching trackercode out of a RW project search, or None if nothing matched.
+    """
+    if len(all_projects) > 1:
+        # this might happen if you have the array and tag projects in RW - they are usually the same prefix and we can't search for word boundaries
+        # filter regex clientside
+        rprojectname = re.compile(f"{trackercode}\\b")
+        filter_projects = [p for p in all_projects if rprojectname.match(p['name'])]
+        if len(filter_projects) == 1:
+            logger.debug("_select_project: multiple matching projects for project '%s', found prefix match '%s...'", trackercode, filter_projects[0]['name'][0:20])
+            all_projects = filter_projects
+        else:
+            raise ValueError(f"Too many projects returned from graphql query ({len(all_projects)}): {','.join((p['name'] for p in all_projects))}")
+    elif len(all_projects) == 0:
+        return None
+
+    return all_projects[0]
+
+
+def _parse_project(trackercode: str, all_projects: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Turns the nested project/folder/file nodes of a project search into a flat resolution entry.
+
+    Deleted files are dropped.  A project RW doesn't know about resolves with a project_id of None and no files.
+    """
+    project = _select_project(trackercode, all_projects)
+    if project is None:
+        logger.warning("_parse_project: no projects found for %s", trackercode)
+        return {
+            'project_id': None,
+            'folder_id': None,
+            'files': []
+        }
+
+    folder_nodes = project['folders']['nodes']
+    if len(folder_nodes) > 1:
+        raise ValueError(f"Too many folders returned from graphql query ({len(folder_nodes)})")
+
+    if len(folder_nodes) == 0:
+        raise ValueError(f"No '{DETECTIONS_FOLDER}' folder found in graphql query (trackercode: {trackercode})")
+
+    folder = folder_nodes[0]
+
+    return {
+        'project_id': project['id'],
+        'folder_id': folder['id'],
+        'files': [
+            {
+                'id': n['id'],
+                'name': n['name']
+            } for n in folder['files']['nodes'] if n['deleted'] == None
+        ]
+    }
+
+
+def _query_projects(trackercodes: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolves the project, folder and files of every trackercode with a single aliased GraphQL query.
+
+    Projects that can't be resolved unambiguously are logged and left out of the result.
+    """
+    variables = {f"t{i}": tc for i, tc in enumerate(trackercodes)}
+    selections = "\n".join(
+        f"""
+        p{i}: projects(search: $t{i}) {{
+            nodes {{
+                name,
+                id
+                folders(search: "{DETECTIONS_FOLDER}") {{
+                    nodes {{
+                        id,
+                        name
+                        files {{
+                            nodes {{
+                                id,
+                                name,
+                                deleted
+                            }}
+                        }}
+                    }}
+                }}
+            }}
+        }}"""
+        for i in range(len(trackercodes))
+    )
+    query = f"""
+    query ResolveProjects({", ".join(f"$t{i}: String" for i in range(len(trackercodes)))}) {{
+        organization(id: {RW_ORGANIZATION_ID}) {{
+            {selections}
+        }}
+    }}
+    """
+
+    logger.info("_query_projects: resolving %d projects", len(trackercodes))
+    data = post_graphql(query, variables, "_query_projects")
+    organization = data['organization']
+
+    ret: Dict[str, Dict[str, Any]] = {}
+    for i, tc in enumerate(trackercodes):
+        try:
+            ret[tc] = _parse_project(tc, organization[f"p{i}"]['nodes'])
+        except ValueError as e:
+            logger.warning("_query_projects: could not resolve %s: %s", tc, str(e))
+
+    return ret
+
+
+def resolve_projects(trackercodes: Sequence[str], refresh: bool=False) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolves RW ids for many projects, using cached resolutions where available.
+
+    Everything not in cache is resolved with one GraphQL round trip and cached for CONFIG.rw_resolve_ttl seconds.
+    Returns a mapping of trackercode -> {'project_id', 'folder_id', 'files': [{'id', 'name'}]}, omitting any
+    project that could not be resolved.
+
+    @param  refresh     Ignore cached resolutions and query RW for every trackercode.
+    """
+    ret: Dict[str, Dict[str, Any]] = {}
+
+    if not refresh:
+        for tc in trackercodes:
+            cv = read_cache(get_resolve_cache_key(tc))
+            if cv is not None:
+                ret[tc] = cv
+
+    missing = [tc for tc in trackercodes if tc not in ret]
+    if missing:
+        resolved = _query_projects(missing)
+        for tc, entry in resolved.items():
+            write_cache(get_resolve_cache_key(tc), entry, ttl=CONFIG.rw_resolve_ttl)
+
+        ret.update(resolved)
+
+    return ret
+
+
+def resolve_project(trackercode: str, refresh: bool=False) -> Dict[str, Any]:
+    """
+    Resolves RW ids for a single project, raising a ValueError if it can't be resolved unambiguously.
+    """
+    resolved = resolve_projects([trackercode], refresh=refresh)
+    if trackercode not in resolved:
+        raise ValueError(f"Could not resolve RW project for {trackercode}")
+
+    return resolved[trackercode]
+
+
+def get_detection_file(trackercode: str, year: str, refresh: bool=False) -> Dict[str, Any]:
+    """
+    Finds the single detection extract zip file node for a project year.
+
+    A cached resolution that has no file for the year is refreshed once before giving up, as the extract may have
+    been uploaded since it was cached.
+    """
+    resolution = resolve_project(trackercode, refresh=refresh)
+    nodes = [n for n in resolution['files'] if str(year) in n['name'] and n['name'].endswith('.zip') and "external_partners" not in n['name']]
+    if len(nodes) > 1:
+        raise ValueError(f"Too many files returned from graphql query ({len(nodes)}): {','.join((n['name'] for n in nodes))}")
+
+    if len(nodes) == 0:
+        if not refresh:
+            logger.info("get_detection_file: no %s/%s file in cached resolution, refreshing", trackercode, year)
+            return get_detection_file(trackercode, year, refresh=True)
+
+        raise ValueError(f"No source data zip found in graphql query (trackercode: {trackercode}, year: {year})")
+
+    return nodes[0]
+
+
+def get_file_url(node: Dict[str, Any]) -> str:
+    """
+    Download URL for a RW file node.
+    """
+    return f"https://researchworkspace.com/files/{node['id']}/{node['name']}"
+
+
+def get_resolved_active_years(resolution: Dict[str, Any]) -> List[int]:
+    """
+    Extracts the years that have matched detection extracts from a project resolution.
+    """
+    nodes = [n['name'] for n in resolution['files'] if 'matched_detections' in n['name'] and n['name'].endswith('.zip')]
+
+    # strip .zip off right, find last _, extract, convert to int (if able)
+    def tryint(n: str) -> Optional[int]:
+        try:
+            return int(n[n.rindex('_')+1:-4])
+        except ValueError:
+            return None
+
+    years = [nn for nn in (tryint(n) for n in nodes) if nn is not None]
+    return sorted(years)
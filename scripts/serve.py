@@ -4,7 +4,7 @@ from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from scripts.config import ALLOWED_PROJECTS
-from scripts.fetch import get_project_active_years_from_graphql
+from scripts.fetch import get_project_active_years_from_graphql, get_projects_active_years_from_graphql
 
 from . import tasks
 from .cache import get_projects_for_species, read_cache, get_species_ids, get_species_months, get_species_years, get_data_inventory, get_citations, get_species_for_project
@@ -28,8 +28,11 @@ def check_project_code(project_code: str):
         raise HTTPException(status_code=403, detail="Project code not allowed")
 
 
+# The POST endpoints below only queue celery tasks, but doing so blocks on the broker, redis and (for project
+# years) RW.  They are plain defs so FastAPI runs them in its threadpool instead of stalling the event loop that
+# serves the GET endpoints.
 @app.post('/atp/process_all/{species_aphia_id}/{type}')
-async def process_atp_all(species_aphia_id: int, type: ATPType, year: Optional[int]=None, project_code: Optional[str]=None):
+def process_atp_all(species_aphia_id: int, type: ATPType, year: Optional[int]=None, project_code: Optional[str]=None):
     """
     Do an "ALL" processing.
 
@@ -74,14 +77,15 @@ async def process_atp_all(species_aphia_id: int, type: ATPType, year: Optional[i
 
 
 @app.post('/atp/{project_code}/{type}/{year}')
-async def process_atp_project(project_code: str, year: int, type: ATPType, force: Optional[bool]=None):
+def process_atp_project(project_code: str, year: int, type: ATPType, force: Optional[bool]=None, incremental: Optional[bool]=None):
     check_project_code(project_code)
 
     kwargs = {
         'project_code': project_code,
         'year': year,
         'type': type.value,
-        'force': force or False
+        'force': force or False,
+        'incremental': incremental or False
     }
 
     if type == ATPType.all:
@@ -111,7 +115,7 @@ async def process_atp_project(project_code: str, year: int, type: ATPType, force
 
 
 @app.post('/atp/PROCESS_DEFAULT')
-async def process_defaults(type: Optional[ATPType]=None, limit: Optional[str] = None, force: Optional[bool] = None):
+def process_defaults(type: Optional[ATPType]=None, limit: Optional[str] = None, force: Optional[bool] = None, incremental: Optional[bool] = None):
     """
     @ TODO: get smarter about refreshing existing projects - get last known year/month and only do that -> forward
     """
@@ -133,9 +137,10 @@ async def process_defaults(type: Optional[ATPType]=None, limit: Optional[str] =
 
     ret = []
 
-    for p in projects:
-        logger.debug("process_defaults: project %s getting active years", p)
-        years = get_project_active_years_from_graphql(p)
+    logger.debug("process_defaults: getting active years for %d projects", len(projects))
+    project_years = get_projects_active_years_from_graphql(projects)
+
+    for p, years in project_years.items():
         logger.info("process_defaults: project %s has %d years: %s", p, len(years), ",".join((str(y) for y in years)))
         for y in years:
             for t in types:
@@ -143,7 +148,8 @@ async def process_defaults(type: Optional[ATPType]=None, limit: Optional[str] =
                     'project_code': p,
                     'year': y,
                     'type': t.value,
-                    'force': force or False
+                    'force': force or False,
+                    'incremental': incremental or False
                 }
 
                 tasks.run_atp_process.apply_async(kwargs=kwargs)
@@ -153,7 +159,7 @@ async def process_defaults(type: Optional[ATPType]=None, limit: Optional[str] =
 
 
 @app.post('/atp/PROCESS_DEFAULT_ALLS')
-async def process_defaults_all(type: Optional[ATPType] = None, limit_species: Optional[List[int]]=Query(None)):
+def process_defaults_all(type: Optional[ATPType] = None, limit_species: Optional[List[int]]=Query(None)):
     """
     Queues jobs that process:
     - for all species:
@@ -225,7 +231,7 @@ async def process_defaults_all(type: Optional[ATPType] = None, limit_species: Op
 
 
 @app.post('/atp/{project_code}')
-async def process_atp_project_all_years(project_code: str, type: Optional[ATPType]=None, force: Optional[bool]=None):
+def process_atp_project_all_years(project_code: str, type: Optional[ATPType]=None, force: Optional[bool]=None, incremental: Optional[bool]=None):
     """
     Queues multiple processing jobs for a project, for each active year.
 
@@ -252,7 +258,8 @@ async def process_atp_project_all_years(project_code: str, type: Optional[ATPTyp
                 'project_code': project_code,
                 'year': y,
                 'type': t.value,
-                'force': force or False
+                'force': force or False,
+                'incremental': incremental or False
             }
 
             tasks.run_atp_process.apply_async(kwargs=kwargs)
@@ -263,7 +270,7 @@ async def process_atp_project_all_years(project_code: str, type: Optional[ATPTyp
 
 
 @app.post('/atp/process_all_for_project/{project_code}')
-async def process_all_for_project(project_code: str, type: Optional[ATPType]=None, limit_species: Optional[List[int]]=Query(None)):
+def process_all_for_project(project_code: str, type: Optional[ATPType]=None, limit_species: Optional[List[int]]=Query(None)):
     """
     Queues jobs that process:
     - for each species in specified project:
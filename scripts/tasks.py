@@ -18,7 +18,7 @@ app = Celery('atp', broker=str(CONFIG.redis_celery_dsn))
 
 
 @app.task
-def run_atp_process(project_code: str, year: int, type: ATPType, month: Optional[int] = None, force: bool=False):
+def run_atp_process(project_code: str, year: int, type: ATPType, month: Optional[int] = None, force: bool=False, incremental: bool=False):
     agg_method, summary_method = get_methods_for_type(type)
     month_arg: Dict[str, int] = {}
     if month:
@@ -32,6 +32,7 @@ def run_atp_process(project_code: str, year: int, type: ATPType, month: Optional
         round_decimals=1,
         **month_arg,
         force=force,
+        incremental=incremental,
     )
 
     ret_val = cache_results(vals, type)
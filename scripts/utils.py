@@ -1,7 +1,10 @@
+import os
 import sys
+import tempfile
 from contextlib import contextmanager
 from enum import Enum
-from typing import Tuple
+from pathlib import Path
+from typing import Iterator, Tuple, Union
 
 
 def get_atp_cache_key(prefix, year, species_aphia_id, type, project_code='_ALL', month='all', **kwargs) -> str:
@@ -35,6 +38,24 @@ def lock(rc, locking_name, blocking_timeout=None):
         print("LOCK REL", locking_name, file=sys.stderr)
 
 
+@contextmanager
+def replacing(path: Union[str, Path]) -> Iterator[Path]:
+    """
+    Yields a fresh temporary path next to path to write to, which is moved over path once the body finishes.
+
+    Readers of path only ever see the old file or the complete new one, and concurrent writers can't interleave.
+    Nothing is replaced if the body raises.
+    """
+    p = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=f"{p.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield Path(tmp)
+        os.replace(tmp, p)
+    finally:
+        Path(tmp).unlink(missing_ok=True)
+
+
 def get_methods_for_type(dtype: ATPType) -> Tuple[str, str]:
     """
     Returns the agg and summary method names for the given type.
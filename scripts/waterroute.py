@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+"""Shortest water paths over a rasterized water mask, an alternative to routing over the land visibility graph."""
+import hashlib
+import math
+import sys
+import threading
+import time
+from functools import cache
+from pathlib import PosixPath as Path
+from typing import Optional, Tuple
+
+import click
+import geojson
+import numpy as np
+import shapely
+from scipy import ndimage
+from shapely.geometry import LineString, shape
+from skimage.graph import MCP_Geometric
+
+from .config import CONFIG
+from .log import logger
+from .utils import replacing
+
+
+class WaterGrid:
+    """
+    A lon/lat raster of water cells with a least-cost router over it.
+
+    Cell (row, col) is centered at (west + (col + 0.5) * resolution, south + (row + 0.5) * resolution).  Routes
+    move between 8-connected water cells, with east/west steps shortened by the cosine of the grid's middle
+    latitude so path costs approximate distance.  Points on land are snapped to their nearest water cell.
+    """
+
+    def __init__(self, water: np.ndarray, west: float, south: float, resolution: float, nearest: Optional[np.ndarray]=None, name: str="watergrid"):
+        self.name = name
+        self.water = water
+        self.west = west
+        self.south = south
+        self.resolution = resolution
+
+        if nearest is None:
+            nearest = ndimage.distance_transform_edt(~water, return_distances=False, return_indices=True)
+        self.nearest = nearest.astype(np.int32)
+
+        mid_lat = south + resolution * water.shape[0] / 2
+        self._mcp = MCP_Geometric(
+            np.where(water, 1.0, np.inf),
+            sampling=(1.0, math.cos(math.radians(mid_lat)))
+        )
+        self._lock = threading.Lock()
+
+    def to_cell(self, lon: float, lat: float) -> Tuple[int, int]:
+        """
+        Nearest water cell to a point.
+        """
+        row = int(np.clip((lat - self.south) // self.resolution, 0, self.water.shape[0] - 1))
+        col = int(np.clip((lon - self.west) // self.resolution, 0, self.water.shape[1] - 1))
+
+        return int(self.nearest[0, row, col]), int(self.nearest[1, row, col])
+
+    def to_lonlat(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Centers of an [N,2] array of (row, col) cells as an [N,2] array of (lon, lat).
+        """
+        return np.column_stack([
+            self.west + (cells[:, 1] + 0.5) * self.resolution,
+            self.south + (cells[:, 0] + 0.5) * self.resolution,
+        ])
+
+    def is_clear(self, a: np.ndarray, b: np.ndarray) -> bool:
+        """
+        Whether the straight run between two cells only crosses water cells.
+        """
+        steps = int(np.ceil(np.abs(b - a).max() * 4)) + 1
+        rows = np.rint(np.linspace(a[0], b[0], steps)).astype(int)
+        cols = np.rint(np.linspace(a[1], b[1], steps)).astype(int)
+
+        return bool(self.water[rows, cols].all())
+
+    def pull_string(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Drops cells from a cell path wherever a straight run over water can skip them, keeping the first and last.
+        """
+        keep = [0]
+        i = 0
+        while i < len(cells) - 1:
+            j = i + 1
+            while j + 1 < len(cells) and self.is_clear(cells[i], cells[j + 1]):
+                j += 1
+
+            keep.append(j)
+            i = j
+
+        return cells[keep]
+
+    def shortest_path(self, lon_start: float, lat_start: float, lon_end: float, lat_end: float) -> Tuple[Tuple[float, float], ...]:
+        """
+        Least-cost water path between two points, as a tuple of (lon, lat) vertices including both endpoints.
+
+        The staircase of cells is straightened wherever that stays over water.  Points in unconnected bodies of water
+        get a straight line.
+        """
+        start = self.to_cell(lon_start, lat_start)
+        end = self.to_cell(lon_end, lat_end)
+
+        if start == end:
+            return ((lon_start, lat_start), (lon_end, lat_end))
+
+        with self._lock:
+            self._mcp.find_costs([start], [end])
+            try:
+                cells = np.asarray(self._mcp.traceback(end))
+            except ValueError:
+                # separate bodies of water, nothing to route around
+                logger.debug("WaterGrid.shortest_path: no water path from %s to %s", start, end)
+                return ((lon_start, lat_start), (lon_end, lat_end))
+
+        coords = [(lon_start, lat_start), *(tuple(c) for c in self.to_lonlat(self.pull_string(cells)).tolist()), (lon_end, lat_end)]
+
+        # an endpoint at its cell's center would otherwise repeat
+        return tuple(c for i, c in enumerate(coords) if i == 0 or c != coords[i - 1])
+
+
+def rasterize_water(filename: str, resolution: float) -> Tuple[np.ndarray, float, float]:
+    """
+    Marks every cell whose center is inside the water polygons.
+
+    Returns the boolean mask (rows south to north, cols west to east) and its west/south edges.
+    """
+    with open(filename) as f:
+        water = shape(geojson.load(f).geometry)
+
+    shapely.prepare(water)
+
+    west, south, east, north = water.bounds
+    lons = west + resolution * (np.arange(int(np.ceil((east - west) / resolution))) + 0.5)
+    lats = south + resolution * (np.arange(int(np.ceil((north - south) / resolution))) + 0.5)
+    grid_lons, grid_lats = np.meshgrid(lons, lats)
+
+    return shapely.contains_xy(water, grid_lons, grid_lats), west, south
+
+
+def get_water_grid_path(filename: str, resolution: float) -> Path:
+    """
+    On-disk cache location of a water grid, named by a hash of the water polygons and the resolution so a new
+    coastline or resolution never reuses a stale raster.
+    """
+    h = hashlib.sha256(Path(filename).read_bytes())
+    h.update(repr(float(resolution)).encode('utf-8'))
+
+    return Path(CONFIG.data_dir) / Path(f"watergrid-{h.hexdigest()[:16]}.npz")
+
+
+@cache
+def build_water_grid(filename: str="data/secoora-water.geojson", resolution: Optional[float]=None) -> WaterGrid:
+    """
+    Loads the water grid for a water polygon file, rasterizing and caching it on disk first if needed.
+
+    @param  resolution  Cell size in degrees, defaults to CONFIG.water_grid_resolution.
+    """
+    resolution = CONFIG.water_grid_resolution if resolution is None else resolution
+
+    saved = get_water_grid_path(filename, resolution)
+    if saved.exists():
+        with np.load(str(saved)) as npz:
+            return WaterGrid(npz['water'], float(npz['west']), float(npz['south']), resolution, nearest=npz['nearest'], name=saved.stem)
+
+    logger.info("build_water_grid: rasterizing %s at %s degrees", filename, resolution)
+    water, west, south = rasterize_water(filename, resolution)
+    grid = WaterGrid(water, west, south, resolution, name=saved.stem)
+
+    # other workers may be loading it already
+    with replacing(saved) as tmp, tmp.open('wb') as f:
+        np.savez_compressed(f, water=water, west=west, south=south, nearest=grid.nearest)
+    logger.info("build_water_grid: cached %s", saved)
+
+    return grid
+
+
+def path_length_km(coords: np.ndarray) -> float:
+    """
+    Great circle length of a lon/lat path.
+    """
+    lons, lats = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    a = np.sin(np.diff(lats) / 2) ** 2 + np.cos(lats[:-1]) * np.cos(lats[1:]) * np.sin(np.diff(lons) / 2) ** 2
+
+    return float(6371.0088 * 2 * np.arcsin(np.sqrt(a)).sum())
+
+
+@click.command()
+@click.option("--pairs", type=int, default=200, help="Number of random water point pairs to route")
+@click.option("--max-distance", type=float, default=1.0, help="Max separation of a pair, in degrees")
+@click.option("--seed", type=int, default=0)
+def bench(pairs: int, max_distance: float, seed: int):
+    """
+    Compares grid and visgraph routing on random pairs of water points: per-route latency, path length, and how much
+    of each path crosses land.
+    """
+    from .process import build_vis_graph
+    import pyvisgraph as vg
+
+    with open("data/secoora-land.geojson") as f:
+        land = shape(geojson.load(f).geometry)
+    shapely.prepare(land)
+
+    t = time.perf_counter()
+    grid = build_water_grid()
+    print(f"grid load/build: {time.perf_counter() - t:.2f}s", file=sys.stderr)
+
+    t = time.perf_counter()
+    g = build_vis_graph()
+    print(f"visgraph load/build: {time.perf_counter() - t:.2f}s", file=sys.stderr)
+
+    # random pairs of water cell centers no more than max_distance apart
+    rng = np.random.default_rng(seed)
+    rows, cols = np.nonzero(grid.water)
+    starts = rng.integers(len(rows), size=pairs)
+    water_points = grid.to_lonlat(np.column_stack([rows, cols]))
+    endpoints = []
+    for s in starts:
+        near = np.flatnonzero(np.abs(water_points - water_points[s]).max(axis=1) <= max_distance)
+        endpoints.append((water_points[s], water_points[rng.choice(near)]))
+
+    results = {}
+    for method in ['visgraph', 'grid']:
+        times, lengths, on_land = [], [], []
+        for (lon0, lat0), (lon1, lat1) in endpoints:
+            t = time.perf_counter()
+            if method == 'grid':
+                coords = np.asarray(grid.shortest_path(lon0, lat0, lon1, lat1))
+            else:
+                coords = np.asarray([(p.x, p.y) for p in g.shortest_path(vg.Point(lon0, lat0), vg.Point(lon1, lat1))])
+            times.append(time.perf_counter() - t)
+
+            line = LineString(coords) if len(coords) > 1 else LineString([coords[0], coords[0]])
+            lengths.append(path_length_km(coords))
+            on_land.append(line.intersection(land).length / line.length if line.length else 0.0)
+
+        results[method] = (np.asarray(times), np.asarray(lengths), np.asarray(on_land))
+
+    for method, (times, lengths, on_land) in results.items():
+        print(
+            f"{method:>8}: median {np.median(times) * 1000:.1f}ms  p95 {np.percentile(times, 95) * 1000:.1f}ms  "
+            f"mean length {lengths.mean():.1f}km  mean share over land {on_land.mean():.2%}"
+        )
+
+    # pairs without a straight line over water are the ones routing is for
+    blocked = np.asarray([LineString([a, b]).intersects(land) for a, b in endpoints])
+    ratio = results['grid'][1] / np.where(results['visgraph'][1] > 0, results['visgraph'][1], np.nan)
+    print(f"grid/visgraph length ratio: median {np.nanmedian(ratio):.3f}  p95 {np.nanpercentile(ratio, 95):.3f}")
+    if blocked.any():
+        print(
+            f"  {blocked.sum()} pairs blocked by land: median {np.nanmedian(ratio[blocked]):.3f}  "
+            f"p95 {np.nanpercentile(ratio[blocked], 95):.3f}  "
+            f"median visgraph {np.median(results['visgraph'][0][blocked]) * 1000:.1f}ms  "
+            f"grid {np.median(results['grid'][0][blocked]) * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    bench()
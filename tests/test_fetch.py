@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+"""Tests for `scripts.fetch`."""
+
+from contextlib import nullcontext
+from io import BytesIO
+from tempfile import TemporaryFile
+from zipfile import ZipFile
+
+import pandas as pd
+import pytest
+import requests
+
+from scripts import fetch
+from scripts.config import CONFIG
+from scripts.fetch import (
+    download_to_tempfile,
+    fetch_project_years,
+    get_all_tables,
+    get_manifest_path,
+    is_source_unchanged,
+    read_csv_from_zip,
+    write_detection_chunks,
+    write_manifest,
+)
+
+
+@pytest.fixture
+def zipped_csv():
+    """A temporary zip file containing a single detections-like CSV of 10 rows."""
+    rows = "".join(f"2020-01-0{i % 9 + 1},{i}\n" for i in range(10))
+
+    tf = TemporaryFile()
+    with ZipFile(tf, "w") as zf:
+        zf.writestr("detections.csv", "datecollected,value\n" + rows)
+    tf.seek(0)
+
+    yield tf
+    tf.close()
+
+
+def test_read_csv_from_zip(zipped_csv):
+    """The CSV member is read straight out of the zip, kwargs and all."""
+    df = read_csv_from_zip(zipped_csv, parse_dates=["datecollected"])
+
+    assert len(df) == 10
+    assert df.index.tolist() == list(range(10))
+    assert df["value"].tolist() == list(range(10))
+    assert str(df["datecollected"].dtype) == "datetime64[ns]"
+
+
+class FakeStreamResponse:
+    """Just enough of a streamed requests response to download from."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+def test_download_to_tempfile_is_readable_as_zip(monkeypatch):
+    """The downloaded file is handed straight to ZipFile, in small chunks, and reads back the CSV member."""
+    body = BytesIO()
+    with ZipFile(body, "w") as zf:
+        zf.writestr("detections.csv", "datecollected,value\n2020-01-01,1\n2020-01-02,2\n")
+
+    monkeypatch.setattr(fetch.httpclient, "get", lambda url, **kwargs: FakeStreamResponse(body.getvalue()))
+    monkeypatch.setattr(CONFIG, "download_chunk_size", 7)
+
+    with download_to_tempfile("https://example.invalid/detections.zip") as tf:
+        df = read_csv_from_zip(tf)
+
+    assert df["value"].tolist() == [1, 2]
+
+
+def test_write_detection_chunks_with_uneven_chunks(tmp_path):
+    """A small first chunk with no species names doesn't limit the categories or nulls of later chunks."""
+    def chunk(fieldnumbers, scientificname):
+        n = len(fieldnumbers)
+        return pd.DataFrame(
+            {
+                "fieldnumber": fieldnumbers,
+                "latitude": [29.0] * n,
+                "longitude": [-80.0] * n,
+                "datecollected": pd.date_range("2020-01-01", periods=n, freq="h"),
+                "monthcollected": [1] * n,
+                "scientificname": [scientificname] * n,
+                "commonname": ["Common"] * n,
+                "aphiaid": [None] * n if scientificname is None else [1] * n,
+            }
+        )
+
+    path = tmp_path / "detections.parquet"
+    rows = write_detection_chunks(
+        [chunk(["A", "B"], None), chunk([f"T{i:03d}" for i in range(300)], "Sci")],
+        path,
+    )
+
+    df = pd.read_parquet(path)
+    assert rows == len(df) == 302
+    assert df["fieldnumber"].nunique() == 302
+    assert df["scientificname"].isna().sum() == 2
+    assert isinstance(df["fieldnumber"].dtype, pd.CategoricalDtype)
+
+
+class FakeHeadResponse:
+    """A HEAD response with the given headers, failing raise_for_status for an error status."""
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+def refuse_connection(url, **kwargs):
+    raise requests.ConnectionError("refused")
+
+
+@pytest.fixture
+def manifested_store(tmp_path, monkeypatch):
+    """A store with a manifest for a 100 byte RW file, which RW still resolves to."""
+    node = {"id": "file-1", "name": "detections_2020.zip"}
+    path = tmp_path / "ABC-2020.parquet"
+    path.touch()
+    write_manifest(path, node, 100)
+
+    monkeypatch.setattr(fetch, "get_detection_file", lambda trackercode, year, refresh=True: node)
+    monkeypatch.setattr(fetch, "get_file_url", lambda node: "https://example.invalid/detections_2020.zip")
+    return path
+
+
+@pytest.mark.parametrize(
+    "head,unchanged",
+    [
+        (lambda url, **kwargs: FakeHeadResponse(headers={"Content-Length": "100"}), True),
+        (lambda url, **kwargs: FakeHeadResponse(headers={"Content-Length": "101"}), False),
+        (lambda url, **kwargs: FakeHeadResponse(), False),
+        (lambda url, **kwargs: FakeHeadResponse(status_code=403), False),
+        (refuse_connection, False),
+    ],
+    ids=["same-size", "new-size", "no-length", "error-status", "unreachable"],
+)
+def test_is_source_unchanged_needs_a_matching_size(manifested_store, monkeypatch, head, unchanged):
+    """Only a reported size equal to the recorded one counts as unchanged, a failed HEAD never raises."""
+    monkeypatch.setattr(fetch.httpclient, "head", head)
+
+    assert is_source_unchanged("ABC", "2020", manifested_store) is unchanged
+
+
+def test_get_all_tables_invalidates_manifest(manifested_store, monkeypatch):
+    """A store rewritten from the database no longer passes for the RW file its manifest recorded."""
+    detections = pd.DataFrame(
+        {
+            "fieldnumber": ["A"],
+            "latitude": [29.0],
+            "longitude": [-80.0],
+            "datecollected": pd.to_datetime(["2020-01-01"]),
+            "monthcollected": [1],
+            "scientificname": ["Sci"],
+            "commonname": ["Common"],
+            "aphiaid": [1],
+        }
+    )
+    monkeypatch.setattr(fetch, "stream_df", lambda conn, table_name, trackercode, bin_size: iter([detections]))
+    monkeypatch.setattr(fetch, "get_species_for_df", lambda df, conn=None: df)
+    monkeypatch.setattr(fetch.httpclient, "head", lambda url, **kwargs: FakeHeadResponse(headers={"Content-Length": "100"}))
+
+    get_all_tables("ABC", "2020", str(manifested_store), conn=object())
+
+    assert not get_manifest_path(manifested_store).exists()
+    assert not is_source_unchanged("ABC", "2020", manifested_store)
+    assert len(pd.read_parquet(manifested_store)) == 1
+
+
+def test_fetch_project_years_keeps_years_that_succeed(tmp_path, monkeypatch):
+    """A year without a detection file is reported as failed, the other years are still written."""
+    def get_detection_file(trackercode, year, refresh=True):
+        if year == 2019:
+            raise ValueError("No source data zip found")
+        return {"id": f"file-{year}", "name": f"detections_{year}.zip"}
+
+    written = []
+    monkeypatch.setattr(fetch, "resolve_project", lambda trackercode, refresh=False: {})
+    monkeypatch.setattr(fetch, "get_detection_file", get_detection_file)
+    monkeypatch.setattr(
+        fetch, "download_detections",
+        lambda trackercode, year, node: (pd.DataFrame({"catalognumber": [f"C{year}"]}), node, 100),
+    )
+    monkeypatch.setattr(fetch, "lookup_species", lambda catalognumbers: pd.DataFrame())
+    monkeypatch.setattr(fetch, "finish_detections", lambda df, species_df, path, node, size: written.append(node["id"]))
+    monkeypatch.setattr(fetch, "get_store_path", lambda trackercode, year: tmp_path / f"{trackercode}-{year}.parquet")
+    monkeypatch.setattr(fetch, "lock", lambda r, name: nullcontext())
+
+    ret, failed = fetch_project_years("ABC", years=[2018, 2019, 2020], force=True)
+
+    assert sorted(ret) == [2018, 2020]
+    assert sorted(written) == ["file-2018", "file-2020"]
+    assert list(failed) == [2019]
+    assert isinstance(failed[2019], ValueError)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""Tests for `scripts.httpclient` against a local stub server."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scripts import httpclient
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 503 until `failures` requests have been seen, then 200."""
+
+    failures = 0
+    seen = 0
+
+    def _respond(self):
+        type(self).seen += 1
+        if type(self).seen <= type(self).failures:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = b'{"data": {"ok": true}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._respond()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    """Runs FlakyHandler on an ephemeral local port, yielding its base url."""
+    FlakyHandler.failures = 0
+    FlakyHandler.seen = 0
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fast_session(monkeypatch):
+    """Swaps this thread's shared session for one with no backoff delay."""
+    monkeypatch.setattr(httpclient._local, "session", httpclient.build_session(retries=3, backoff_factor=0), raising=False)
+
+
+def test_post_retries_until_success(stub_server, fast_session):
+    """Retryable statuses are retried on POST and the eventual success is returned."""
+    FlakyHandler.failures = 2
+
+    r = httpclient.post(stub_server, json={"query": "{ ok }"})
+
+    assert r.status_code == 200
+    assert r.json() == {"data": {"ok": True}}
+    assert FlakyHandler.seen == 3
+
+
+def test_exhausted_retries_return_last_response(stub_server, fast_session):
+    """Once retries run out the last response comes back for the caller to handle."""
+    FlakyHandler.failures = 10
+
+    r = httpclient.get(stub_server)
+
+    assert r.status_code == 503
+    assert FlakyHandler.seen == 4
+
+
+def test_session_is_shared_per_thread():
+    """Repeated calls on a thread reuse the same pooled session, other threads get their own."""
+    session = httpclient.get_session()
+    assert httpclient.get_session() is session
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(httpclient.get_session()))
+    t.start()
+    t.join()
+
+    assert other[0] is not session
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Tests for `scripts.hull.ConcaveHull`."""
+
+import numpy as np
+import pytest
+from shapely.geometry import LineString, Point, Polygon
+
+from scripts.hull import ConcaveHull
+
+
+@pytest.fixture
+def points() -> np.ndarray:
+    """A noisy ring of lon/lat points around (-80, 29)."""
+    rng = np.random.default_rng(0)
+    t = rng.uniform(0, 2 * np.pi, 300)
+    r = 1 + rng.normal(0, 0.1, 300)
+    return np.column_stack([-80 + np.cos(t) * r, 29 + np.sin(t) * r])
+
+
+def test_k_nearest_matches_haversine_order(points):
+    """Neighbours from the index are the closest remaining points by haversine distance, nearest first."""
+    hull = ConcaveHull(points)
+    hull.indices[[5, 17, 40]] = False
+
+    remaining = np.flatnonzero(hull.indices)
+    distances = hull.haversine_distance(hull.data_set[0], hull.data_set[remaining])
+    expected = remaining[np.argsort(distances)[:7]]
+
+    np.testing.assert_array_equal(hull.get_k_nearest(0, 7), expected)
+
+
+def test_hull_covers_all_points(points):
+    """The calculated hull is a valid polygon containing every point."""
+    hull = ConcaveHull(points).calculate()
+
+    poly = Polygon(hull)
+    assert poly.is_valid
+    assert all(poly.distance(Point(p)) < 1e-5 for p in points)
+
+
+def test_simple_extension_matches_is_simple():
+    """Testing only the new edge agrees with checking the whole extended path, on a coarse lattice full of touches and overlaps."""
+    rng = np.random.default_rng(1)
+
+    checked = 0
+    while checked < 500:
+        path = rng.integers(0, 4, size=(1, 2)).astype(float)
+        for _ in range(8):
+            candidate = rng.integers(0, 4, size=2).astype(float)
+            if np.array_equal(candidate, path[-1]):
+                continue
+
+            extended = np.vstack([path, candidate])
+            expected = LineString(extended).is_simple
+            assert ConcaveHull.is_simple_extension(path, candidate) == expected, extended.tolist()
+            checked += 1
+
+            if not expected or np.array_equal(candidate, path[0]):
+                break
+            path = extended
+
+
+def test_buffer_in_meters_uses_lon_lat_order():
+    """Buffering grows a lon/lat polygon by the same number of web mercator meters in every direction."""
+    square = Polygon([(-80.1, 28.9), (-79.9, 28.9), (-79.9, 29.1), (-80.1, 29.1)])
+
+    buffered = ConcaveHull.buffer_in_meters(square, 1000)
+
+    west, south, east, north = buffered.bounds
+    assert buffered.contains(square)
+    assert west == pytest.approx(-80.1 - 1000 / 111319.49, abs=1e-6)
+    assert east == pytest.approx(-79.9 + 1000 / 111319.49, abs=1e-6)
+    assert north - 29.1 == pytest.approx(28.9 - south, rel=0.02)
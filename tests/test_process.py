@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+
+"""Tests for `scripts.process` aggregation methods."""
+
+import os
+
+import geopandas
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from billiard import Pool
+
+from scripts import process
+from scripts.fetch import STORE_COLUMNS, write_detections
+from scripts.process import animal_interpolated_paths, daily_avg, monthly_avg, weekly_avg
+
+
+@pytest.fixture
+def detections() -> pd.DataFrame:
+    """Two animals, out of order, with two detections on one day and a gap day."""
+    df = pd.DataFrame(
+        {
+            "fieldnumber": ["B", "A", "A", "A", "B"],
+            "latitude": [30.0, 29.0, 29.5, 28.0, 31.0],
+            "longitude": [-80.0, -79.0, -79.5, -78.0, -81.0],
+            "datecollected": pd.to_datetime(
+                ["2020-01-02 10:00", "2020-01-01 12:00", "2020-01-01 01:00", "2020-01-03 00:00", "2020-02-01 00:00"]
+            ),
+            "scientificname": ["Sci", "Sci", "Sci", "Sci", "Sci"],
+            "commonname": ["Common", "Common", "Common", "Common", "Common"],
+            "aphiaid": [1, 1, 1, 1, 1],
+        }
+    )
+    df["monthcollected"] = df["datecollected"].dt.month
+    df["weekcollected"] = df["datecollected"].dt.isocalendar().week
+    return df
+
+
+@pytest.fixture
+def stored_detections(detections, tmp_path) -> pd.DataFrame:
+    """The detections written to the parquet store and read back as load_df does, names as categoricals."""
+    path = tmp_path / "detections.parquet"
+    write_detections(detections, path)
+
+    df = pd.read_parquet(path, columns=STORE_COLUMNS)
+    df["weekcollected"] = df["datecollected"].dt.isocalendar().week
+    return df
+
+
+@pytest.fixture
+def straight_paths(monkeypatch):
+    """Routes every interpolated path in a straight line, so no routing graph or redis is needed."""
+    get_interp_line = process.get_interp_line
+    monkeypatch.setattr(process, "get_interp_line", lambda *coords, method="visgraph": get_interp_line(*coords, method="simple"))
+
+
+@pytest.mark.parametrize("agg_method", list(process.agg_methods))
+def test_agg_methods_on_store_round_trip(stored_detections, straight_paths, agg_method):
+    """Every aggregation method works on detections as they come out of the store."""
+    gdf = process.agg_methods[agg_method]["callable"](stored_detections)
+
+    assert len(gdf) > 0
+    assert gdf.geometry.notna().all()
+
+
+def test_daily_avg(detections):
+    """Positions are averaged per animal per day, ordered by animal then day, indexed by month."""
+    gdf = daily_avg(detections)
+
+    assert gdf["fieldnumber"].tolist() == ["A", "A", "B", "B"]
+    assert gdf["datecollected"].dt.strftime("%Y-%m-%d").tolist() == [
+        "2020-01-01",
+        "2020-01-03",
+        "2020-01-02",
+        "2020-02-01",
+    ]
+    assert gdf["latitude"].tolist() == [29.25, 28.0, 30.0, 31.0]
+    assert gdf["longitude"].tolist() == [-79.25, -78.0, -80.0, -81.0]
+    assert gdf.index.tolist() == [1, 1, 1, 2]
+    assert gdf["commonname"].unique().tolist() == ["Common"]
+
+
+def test_daily_avg_categorical(detections):
+    """Categorical name columns give the same result as plain strings."""
+    categorical = detections.astype({c: "category" for c in ["fieldnumber", "commonname", "scientificname"]})
+
+    pd.testing.assert_frame_equal(daily_avg(categorical), daily_avg(detections))
+
+
+def test_animal_interpolated_paths_simple(detections):
+    """Short gaps are filled with evenly spaced points on the line between days, long gaps are left alone."""
+    gdf = animal_interpolated_paths(detections, interp_method="simple", max_day_gap=15)
+
+    assert gdf["fieldnumber"].tolist() == ["A", "A", "A", "B", "B"]
+    assert gdf["datecollected"].dt.strftime("%Y-%m-%d").tolist() == [
+        "2020-01-01",
+        "2020-01-02",
+        "2020-01-03",
+        "2020-01-02",
+        "2020-02-01",
+    ]
+    assert gdf["latitude"].tolist() == pytest.approx([29.25, 28.625, 28.0, 30.0, 31.0])
+    assert gdf["longitude"].tolist() == pytest.approx([-79.25, -78.625, -78.0, -80.0, -81.0])
+    assert gdf.iloc[1]["commonname"] == "Common"
+    assert gdf.index.tolist() == [1, 1, 1, 1, 2]
+
+
+class FakeHashStore:
+    """Just enough of a redis client for the hash commands the path memo uses."""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def hget(self, name, key):
+        return self.hashes.get(name, {}).get(key)
+
+    def hset(self, name, key, value):
+        self.hashes.setdefault(name, {})[key] = value.encode("utf-8")
+
+
+class CountingGraph:
+    """Routes through a fixed waypoint and counts how often it is asked to."""
+
+    calls = 0
+
+    def shortest_path(self, origin, destination):
+        type(self).calls += 1
+        return [origin, type(origin)(-80.0, 30.0), destination]
+
+
+def test_visgraph_paths_are_memoized(monkeypatch):
+    """A route is computed once per rounded pair, in either direction, and survives losing the in-process cache."""
+    monkeypatch.setattr(process, "r", FakeHashStore())
+    monkeypatch.setattr(process, "build_vis_graph", lambda: CountingGraph())
+    CountingGraph.calls = 0
+    process.get_shortest_path.cache_clear()
+
+    line = process.get_interp_line(-81.0, 29.0, -79.0, 31.0)
+    assert list(line.coords) == [(-81.0, 29.0), (-80.0, 30.0), (-79.0, 31.0)]
+
+    # nearby endpoints and the reverse direction reuse the route, keeping their exact endpoints
+    nearby = process.get_interp_line(-81.000001, 29.0, -79.0, 31.0)
+    assert list(nearby.coords)[0] == (-81.000001, 29.0)
+    reverse = process.get_interp_line(-79.0, 31.0, -81.0, 29.0)
+    assert list(reverse.coords) == [(-79.0, 31.0), (-80.0, 30.0), (-81.0, 29.0)]
+
+    # other workers only have the shared store
+    process.get_shortest_path.cache_clear()
+    process.get_interp_line(-81.0, 29.0, -79.0, 31.0)
+
+    assert CountingGraph.calls == 1
+    process.get_shortest_path.cache_clear()
+
+
+def test_path_cache_key_is_worked_out_once(monkeypatch):
+    """Path lookups don't hash the land polygons every time they name the redis hash."""
+    hashed = []
+
+    def get_vis_graph_path():
+        hashed.append(1)
+        return process.Path("landvisgraph-abc.pk1")
+
+    monkeypatch.setattr(process, "get_vis_graph_path", get_vis_graph_path)
+    process.get_path_cache_key.cache_clear()
+
+    assert process.get_path_cache_key() == process.get_path_cache_key() == "visgraph:landvisgraph-abc:paths"
+    assert len(hashed) == 1
+    process.get_path_cache_key.cache_clear()
+
+
+def test_vis_graph_path_is_content_addressed(tmp_path):
+    """The cached graph is named by the land polygons and build parameters."""
+    land = tmp_path / "land.geojson"
+    land.write_text('{"type": "MultiPolygon", "coordinates": []}')
+
+    path = process.get_vis_graph_path(str(land), simplify=0.01)
+
+    assert path == process.get_vis_graph_path(str(land), simplify=0.01)
+    assert path != process.get_vis_graph_path(str(land), simplify=0.02)
+
+    land.write_text('{"type": "MultiPolygon", "coordinates": [[[[0, 0], [1, 0], [1, 1], [0, 0]]]]}')
+    assert path != process.get_vis_graph_path(str(land), simplify=0.01)
+
+
+def test_sharded_aggregation_matches_in_process(detections):
+    """Sharding animals over a process pool gives the same frame as aggregating in process."""
+    pd.testing.assert_frame_equal(daily_avg(detections, workers=2), daily_avg(detections, workers=1))
+    pd.testing.assert_frame_equal(
+        animal_interpolated_paths(detections, interp_method="simple", workers=2),
+        animal_interpolated_paths(detections, interp_method="simple", workers=1),
+    )
+
+
+def test_sharded_aggregation_loads_routing_once(detections, straight_paths, tmp_path, monkeypatch):
+    """The routing graph is loaded once before the pool starts, and its workers never load their own."""
+    loads = tmp_path / "loads"
+
+    def build_vis_graph():
+        with loads.open("a") as f:
+            f.write(f"{os.getpid()}\n")
+
+    monkeypatch.setattr(process, "build_vis_graph", build_vis_graph)
+    animal_interpolated_paths(detections, interp_method="visgraph", workers=2)
+
+    assert loads.read_text().split() == [str(os.getpid())]
+
+
+def _shard_in_daemon(df: pd.DataFrame):
+    """Shards daily_avg from inside a daemonic worker, as a celery prefork task would."""
+    return process._by_animal_shards(daily_avg, df, workers=2)
+
+
+def test_sharded_aggregation_in_daemonic_worker(detections):
+    """Sharding still uses its own pool when already running in a daemonic pool worker."""
+    with Pool(processes=1) as pool:
+        sharded = pool.apply(_shard_in_daemon, (detections,))
+
+    assert sharded is not None
+    pd.testing.assert_frame_equal(sharded, daily_avg(detections, workers=1))
+
+
+@pytest.fixture
+def compact(detections) -> pd.DataFrame:
+    """The detections in the dtypes load_df(compact=True) gives rounded detections."""
+    return detections.astype(
+        {
+            **{c: "category" for c in ["fieldnumber", "commonname", "scientificname"]},
+            "latitude": "float32",
+            "longitude": "float32",
+            "monthcollected": "int8",
+            "weekcollected": "int8",
+        }
+    )
+
+
+@pytest.mark.parametrize("agg_method", list(process.agg_methods))
+def test_agg_methods_on_compact_dtypes(compact, straight_paths, agg_method):
+    """Every aggregation method works on categorical names, int8 months and weeks, and float32 coordinates."""
+    gdf = process.agg_methods[agg_method]["callable"](compact)
+
+    assert len(gdf) > 0
+    assert gdf.geometry.notna().all()
+
+
+def test_monthly_and_weekly_avg_keep_compact_dtypes(compact):
+    """Averaging works on categorical names and float32 coordinates without upcasting them."""
+    monthly = monthly_avg(compact)
+    assert monthly["latitude"].dtype == "float32"
+    assert isinstance(monthly["commonname"].dtype, pd.CategoricalDtype)
+    assert monthly.loc[monthly["fieldnumber"] == "A", "latitude"].tolist() == pytest.approx([(29.0 + 29.5 + 28.0) / 3])
+
+    weekly = weekly_avg(compact)
+    assert weekly["longitude"].dtype == "float32"
+    assert weekly.index.dtype == "int8"
+    assert sorted(weekly.index.tolist()) == [1, 1, 2]
+
+
+def test_splice_new_detections_matches_full_recompute(detections):
+    """Splicing detections past the high-water mark into a cached aggregate equals aggregating everything again."""
+    later = pd.DataFrame([{**detections.iloc[3].to_dict(), "datecollected": pd.Timestamp("2020-01-06 12:00"), "latitude": 27.0}])
+    old = detections[detections["datecollected"] < pd.Timestamp("2020-01-05")]
+    everything = pd.concat([detections, later], ignore_index=True)
+
+    def agg(df):
+        return animal_interpolated_paths(df, interp_method="simple")
+
+    cached = agg(old)
+    assert process.splice_new_detections(cached, old, process.get_high_water_mark(old), agg) is None
+
+    spliced = process.splice_new_detections(cached, everything, process.get_high_water_mark(old), agg)
+    full = agg(everything)
+
+    assert spliced["datecollected"].tolist() == full["datecollected"].tolist()
+    assert spliced["latitude"].tolist() == pytest.approx(full["latitude"].tolist())
+    assert len(full) == len(cached) + 4
+
+
+def test_summary_concave_geos_covers_positions():
+    """The GEOS concave hull is a single buffered level 1 range around every position, convex for collinear ones."""
+    rng = np.random.default_rng(0)
+    corner = pd.DataFrame(rng.uniform(0, 2, size=(2000, 2)), columns=["longitude", "latitude"])
+    corner = corner[(corner["longitude"] < 1) | (corner["latitude"] < 1)] + [-81, 28]
+
+    summary = process.summary_concave_geos(process.to_gdf(corner))
+
+    assert summary["level"].tolist() == [1]
+    assert summary.geometry[0].contains(shapely.multipoints(corner[["longitude", "latitude"]].to_numpy()))
+    # the empty corner is left out of the range
+    assert not summary.geometry[0].contains(shapely.Point(-79.3, 29.7))
+
+    line = pd.DataFrame({"longitude": [-80.0, -79.5, -79.0], "latitude": [29.0, 29.0, 29.0]})
+    assert not process.summary_concave_geos(process.to_gdf(line)).geometry[0].is_empty
+
+
+@pytest.mark.parametrize(
+    "coords",
+    [
+        np.random.default_rng(0).normal([-80, 29], 1, size=(500, 2)),
+        np.array([[-80.0, 29.0], [-79.0, 29.0], [-79.5, 29.0], [-80.0, 29.0]]),
+        np.array([[-80.0, 29.0], [-80.0, 29.0]]),
+    ],
+    ids=["scattered", "collinear", "single"],
+)
+def test_array_hulls_match_unary_union(coords):
+    """Hulls and rectangles from coordinate arrays are the geometries the union of all points would give."""
+    gdf = process.to_gdf(pd.DataFrame(coords, columns=["longitude", "latitude"]))
+    union = gdf.unary_union
+
+    hull = process.get_convex_hull(gdf)[0]
+    assert hull.geom_type == union.convex_hull.geom_type
+    assert shapely.equals_exact(hull, union.convex_hull, 0)
+
+    rbbox = process.summary_rotated_bbox(gdf)[0]
+    assert rbbox.geom_type == union.minimum_rotated_rectangle.geom_type
+    assert rbbox.area == pytest.approx(union.minimum_rotated_rectangle.area)
+    assert rbbox.buffer(1e-9).contains(union)
+
+    raw = process.summary_raw(gdf)[0]
+    assert raw.geom_type == union.geom_type
+    assert shapely.equals_exact(raw, union, 0)
+
+
+def test_gridsquares_snap_to_lattice():
+    """Grids cover the padded bounds longitude major, and nearby extents get the same lattice cells."""
+    bounds = (-81.0, 28.0, -79.0, 30.0)
+    grid, points = process.make_gridsquares(bounds, resolution=10)
+
+    west, south, east, north = grid.total_bounds
+    assert west <= -82.0 and south <= 27.0 and east >= -78.0 and north >= 31.0
+    assert points["lon"].is_monotonic_increasing
+    assert points["lat"].iloc[1] > points["lat"].iloc[0]
+    assert grid.geometry[0].centroid.equals_exact(points.geometry[0], 1e-9)
+
+    nearby, _ = process.make_gridsquares(np.array([-81.01, 28.02, -79.0, 30.0]), resolution=10)
+    assert shapely.equals_exact(np.asarray(nearby.geometry.values), np.asarray(grid.geometry.values), 0).all()
+
+
+def test_rasterized_track_counts_match_grid_join():
+    """Walking tracks over the lattice counts the same tracks per project and cell as joining them with grid squares."""
+    rng = np.random.default_rng(2)
+    geoms = []
+    for _ in range(60):
+        track = np.cumsum(rng.normal(0, 0.3, size=(rng.integers(1, 6), 2)), axis=0) + [-80, 29]
+        geoms.append(shapely.Point(track[0]) if len(track) == 1 else shapely.LineString(track))
+    tracks = geopandas.GeoDataFrame({"project_code": ["P1", "P2", "P3"] * 20}, geometry=geoms, crs="EPSG:4326")
+    bounds = tracks.total_bounds
+
+    counts, lons, lats, projects = process._rasterize_track_counts(tracks, bounds, resolution=10)
+
+    joined = process._match_with_grid(tracks, bounds, resolution=10)
+    joined.geometry = joined.geometry.apply(lambda x: x.centroid)
+    for i, project in enumerate(projects):
+        bits, grid_lons, grid_lats = process.grid_points_to_array(joined.assign(counts=joined[project]))
+        np.testing.assert_array_equal(counts[i].T, bits)
+
+    np.testing.assert_allclose(lons, grid_lons)
+    np.testing.assert_allclose(lats, grid_lats)
+
+
+def test_high_water_mark_notices_backfilled_detections(detections):
+    """Detections added or edited at or before the mark are noticed, ones after it are not."""
+    hwm = process.get_high_water_mark(detections)
+    assert process.is_before_high_water_mark_unchanged(detections, hwm)
+
+    later = pd.DataFrame([{**detections.iloc[3].to_dict(), "datecollected": pd.Timestamp("2020-03-01")}])
+    assert process.is_before_high_water_mark_unchanged(pd.concat([detections, later], ignore_index=True), hwm)
+
+    backfilled = pd.DataFrame([{**detections.iloc[3].to_dict(), "datecollected": pd.Timestamp("2020-01-05")}])
+    assert not process.is_before_high_water_mark_unchanged(pd.concat([detections, backfilled], ignore_index=True), hwm)
+
+    moved = detections.assign(latitude=detections["latitude"].where(detections.index != 0, 35.0))
+    assert not process.is_before_high_water_mark_unchanged(moved, hwm)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+"""Tests for `scripts.rw` project resolution."""
+
+import pytest
+
+from scripts import rw
+
+
+@pytest.fixture
+def resolutions(monkeypatch):
+    """A cached resolution from before the 2021 extract was uploaded, and the fresh one after it; records refreshes."""
+    cached = {"files": [{"id": "f2020", "name": "ABC_matched_detections_2020.zip"}]}
+    fresh = {"files": cached["files"] + [{"id": "f2021", "name": "ABC_matched_detections_2021.zip"}]}
+    refreshes = []
+
+    def resolve_project(trackercode, refresh=False):
+        refreshes.append(refresh)
+        return fresh if refresh else cached
+
+    monkeypatch.setattr(rw, "resolve_project", resolve_project)
+    return refreshes
+
+
+def test_detection_file_from_cached_resolution(resolutions):
+    """A year the cached resolution knows about doesn't query RW again."""
+    assert rw.get_detection_file("ABC", 2020)["id"] == "f2020"
+    assert resolutions == [False]
+
+
+def test_detection_file_refreshes_stale_resolution(resolutions):
+    """A year missing from the cached resolution is looked for again in a fresh one."""
+    assert rw.get_detection_file("ABC", 2021)["id"] == "f2021"
+    assert resolutions == [False, True]
+
+
+def test_detection_file_missing_after_refresh(resolutions):
+    """A year RW really has no file for still raises, after one refresh."""
+    with pytest.raises(ValueError, match="No source data zip"):
+        rw.get_detection_file("ABC", 2022)
+
+    assert resolutions == [False, True]
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests for `scripts.waterroute` grid routing."""
+
+import numpy as np
+import pytest
+from shapely.geometry import LineString, box
+
+from scripts import waterroute
+from scripts.config import CONFIG
+from scripts.waterroute import WaterGrid
+
+
+@pytest.fixture
+def walled_grid() -> WaterGrid:
+    """A 20x20 grid of 1 degree cells with a land wall at x 10-11 from the south edge up to y 15."""
+    water = np.ones((20, 20), dtype=bool)
+    water[0:15, 10] = False
+    return WaterGrid(water, west=0.0, south=0.0, resolution=1.0)
+
+
+def test_route_goes_around_land(walled_grid):
+    """The path keeps its exact endpoints and detours north of the wall instead of crossing it."""
+    path = walled_grid.shortest_path(2.5, 2.5, 17.5, 2.5)
+
+    assert path[0] == (2.5, 2.5)
+    assert path[-1] == (17.5, 2.5)
+    assert max(y for _, y in path) >= 15.0
+    assert not LineString(path).crosses(box(10.1, 0.0, 10.9, 14.9))
+
+
+def test_land_points_snap_to_water(walled_grid):
+    """A point on land routes from its nearest water cell."""
+    row, col = walled_grid.to_cell(10.5, 5.5)
+
+    assert walled_grid.water[row, col]
+    assert (row, col) in [(5, 9), (5, 11)]
+
+
+def test_unconnected_water_is_a_straight_line():
+    """Points in separate bodies of water fall back to a straight line."""
+    water = np.ones((5, 5), dtype=bool)
+    water[:, 2] = False
+    grid = WaterGrid(water, west=0.0, south=0.0, resolution=1.0)
+
+    assert grid.shortest_path(0.5, 0.5, 4.5, 0.5) == ((0.5, 0.5), (4.5, 0.5))
+
+
+def test_water_grid_is_cached_whole(tmp_path, monkeypatch):
+    """The rasterized grid is swapped into place complete, with no temporary files left, and loads back the same."""
+    water = tmp_path / "water.geojson"
+    water.write_text('{"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [[[0, 0], [4, 0], [4, 3], [0, 3], [0, 0]]]}}')
+    monkeypatch.setattr(CONFIG, "data_dir", str(tmp_path))
+
+    built = waterroute.build_water_grid.__wrapped__(str(water), 1.0)
+    assert [p.name for p in tmp_path.iterdir() if p.suffix != ".geojson"] == [waterroute.get_water_grid_path(str(water), 1.0).name]
+
+    loaded = waterroute.build_water_grid.__wrapped__(str(water), 1.0)
+    assert np.array_equal(loaded.water, built.water)
+    assert loaded.water.all()